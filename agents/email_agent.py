@@ -1,7 +1,15 @@
+import os
 import time
+import zipfile
 from datetime import datetime
 import random
-from utils.file_utils import update_performance_metric
+from utils.file_utils import update_performance_metric, file_type_for, hash_file_content, split_compression
+from utils.mail_stream import parse_message, iter_maildir, iter_mbox, sender_details
+from utils.mail_poller import MailboxPoller
+from utils.content_index import ContentIndex
+from utils.blob_store import BlobStore
+from utils.sender_verification import SenderVerifier
+from utils.archives import list_archive_members
 
 class EmailAgent:
     """
@@ -15,8 +23,19 @@ class EmailAgent:
         self.performance_metrics = {
             "avg_processing_time": 1.2,  # seconds
             "success_rate": 0.99,
-            "emails_processed": 0
+            "emails_processed": 0,
+            "attachments_extracted": 0,
+            "emails_skipped": 0,
+            "duplicates_skipped": 0,
+            "senders_verified": 0,
+            "senders_rejected": 0,
+            "verification_lookups": 0,
+            "archive_members_expanded": 0
         }
+        self.sender_verifier = SenderVerifier()
+        self.content_index = ContentIndex()
+        self.blob_store = BlobStore()
+        self.pollers = {}
     
     def receive_email(self, email_data):
         """
@@ -49,13 +68,205 @@ class EmailAgent:
             "subject": email_data["subject"],
             "received_time": datetime.now(),
             "email_body": email_data.get("email_body", ""),
-            "file_path": f"examples/{email_data['filename']}",
+            "file_path": email_data.get("file_path", f"examples/{email_data['filename']}"),
+            "file_obj": email_data.get("file_obj"),
+            "blob": email_data.get("blob"),
+            "archive_member": email_data.get("archive_member"),
+            "compression": split_compression(email_data["filename"])[1],
             "processing_time": processing_time,
-            "complexity": email_data["complexity"]
+            "complexity": email_data["complexity"],
+            "sender_verification": self.verify_sender(email_data["sender_email"])
         }
         
+        # Spooled attachments were hashed on their way to disk
+        file_info["content_hash"] = email_data.get("content_hash") or hash_file_content(file_info)
+        
         return file_info
     
+    def find_duplicate(self, file_info, file_id):
+        """
+        Looks up whether the content of a file was already ingested under another ID.
+        
+        Args:
+            file_info (dict): Information about the file, as returned by receive_email
+            file_id (str): ID of the file in the pipeline
+            
+        Returns:
+            dict or None: The first ingest (file_id, filename, sender and result), or None if the content is new
+        """
+        if file_info.get("content_hash") is None:
+            return None
+        
+        previous = self.content_index.lookup(file_info["content_hash"])
+        if previous is None or previous["file_id"] == file_id:
+            return None
+        
+        self.performance_metrics["duplicates_skipped"] += 1
+        return previous
+    
+    def record_result(self, file_info, file_id, result):
+        """
+        Remembers the outcome of a file, so exact duplicates of it can be answered without processing.
+        
+        Args:
+            file_info (dict): Information about the file, as returned by receive_email
+            file_id (str): ID of the file in the pipeline
+            result (dict): JSON-serializable outcome of the pipeline
+        """
+        if file_info.get("content_hash") is not None:
+            self.content_index.record(file_info["content_hash"], file_id, file_info["filename"], file_info["sender"], result)
+    
+    def read_mailbox(self, path):
+        """
+        Reads the messages of a local Maildir or mbox and extracts their attachments.
+        
+        Messages are parsed as streams and attachments are decoded straight to
+        spool files on disk, so large attachments are never held in memory.
+        
+        Args:
+            path (str): Maildir directory or mbox file
+            
+        Yields:
+            dict: Email data for each supported attachment, ready for receive_email
+        """
+        if os.path.isdir(path):
+            for message_path in iter_maildir(path):
+                with open(message_path, "rb") as f:
+                    yield from self._email_data(parse_message(f))
+        else:
+            with open(path, "rb") as f:
+                for message_lines in iter_mbox(f):
+                    yield from self._email_data(parse_message(message_lines))
+    
+    def poll_mailbox(self, path, batch_size=50):
+        """
+        Fetches only the messages delivered since the last poll of a local mailbox.
+        
+        The position of the last message seen is persisted, so each poll costs
+        as much as the new mail rather than the whole mailbox. Headers are
+        triaged before the body is read, so rejected messages never have
+        their attachments decoded.
+        
+        Args:
+            path (str): Maildir directory or mbox file
+            batch_size (int): Number of messages fetched per batch
+            
+        Yields:
+            list: Email data for the supported attachments of one batch of messages
+        """
+        if path not in self.pollers:
+            self.pollers[path] = MailboxPoller(path, batch_size=batch_size)
+        for messages in self.pollers[path].poll(accept=self.triage):
+            yield [email_data for message in messages for email_data in self._email_data(message)]
+    
+    def triage(self, headers):
+        """
+        Decides from the headers alone whether a message is worth reading.
+        
+        Args:
+            headers (email.message.EmailMessage): Headers of the message
+            
+        Returns:
+            bool: True if the message can carry attachments and its sender is verified
+        """
+        _, sender_email = sender_details(headers)
+        can_carry_attachments = headers.get_content_maintype() == "multipart" or headers.get_filename() is not None
+        accepted = can_carry_attachments and self.verify_sender(sender_email)["verified"]
+        if not accepted:
+            self.performance_metrics["emails_skipped"] += 1
+        return accepted
+    
+    def expand_archive(self, file_info):
+        """
+        Lists the members of a zip attachment as separate files, without extracting them.
+        
+        Only the central directory is read here. Each member is read straight
+        from the archive when it is processed, and hashed then like any other
+        file, so duplicates among members are still caught on ingest.
+        
+        Args:
+            file_info (dict): Information about the archive, as returned by receive_email
+            
+        Returns:
+            list: Email data for each processable member, ready for receive_email
+        """
+        archive_path = self._archive_path(file_info)
+        if archive_path is None:
+            return []
+        
+        try:
+            members = list_archive_members(archive_path)
+        except zipfile.BadZipFile:
+            return []
+        
+        self.performance_metrics["archive_members_expanded"] += len(members)
+        return [{
+            "filename": os.path.basename(info.filename),
+            "file_type": file_type_for(os.path.basename(info.filename)),
+            "sender": file_info["sender"],
+            "sender_email": file_info["sender_email"],
+            "subject": file_info["subject"],
+            "complexity": file_info["complexity"],
+            "email_body": file_info["email_body"],
+            "file_path": None,  # A member has no path of its own, it is read through archive_member
+            "archive_member": {"archive_path": archive_path, "name": info.filename},
+            "file_size": info.file_size
+        } for info in members]
+    
+    def _archive_path(self, file_info):
+        """Path of the archive on disk, spooling an uploaded archive to the blob store first"""
+        if file_info.get("blob") is not None:
+            return file_info["blob"]["path"]
+        if file_info.get("file_obj") is not None:
+            file_info["file_obj"].seek(0)
+            return self.blob_store.put_stream(file_info["file_obj"])["path"]
+        if file_info.get("file_path") and os.path.isfile(file_info["file_path"]):
+            return file_info["file_path"]
+        return None
+    
+    def verify_sender(self, sender_email):
+        """
+        Verifies a sender against the allow-list, SPF/DKIM results and the partner registry.
+        
+        Results are cached per sender domain for the life of the process,
+        failures for a shorter time than successes.
+        
+        Args:
+            sender_email (str): Address the email was sent from
+            
+        Returns:
+            dict: verified, partner, reason and source, see utils.sender_verification.SenderVerifier
+        """
+        result = self.sender_verifier.verify(sender_email)
+        self.performance_metrics["senders_verified" if result["verified"] else "senders_rejected"] += 1
+        if result["source"] == "lookup":
+            self.performance_metrics["verification_lookups"] += 1
+        return result
+    
+    def _email_data(self, message):
+        """Turn a parsed message into one email data dict per supported attachment"""
+        sender, sender_email = sender_details(message["headers"])
+        for attachment in message["attachments"]:
+            file_type = file_type_for(attachment["filename"])
+            if file_type is None:
+                os.remove(attachment["path"])
+                continue
+            self.performance_metrics["attachments_extracted"] += 1
+            blob = self.blob_store.adopt(attachment["path"], attachment["content_hash"])
+            yield {
+                "filename": attachment["filename"],
+                "file_type": file_type,
+                "sender": sender,
+                "sender_email": sender_email,
+                "subject": str(message["headers"].get("Subject", "")),
+                "complexity": "unknown",
+                "email_body": message["body"],
+                "file_path": blob["path"],
+                "file_size": attachment["size"],
+                "content_hash": attachment["content_hash"],
+                "blob": blob
+            }
+    
     def get_performance_stats(self):
         """Returns the current performance metrics for this agent"""
         return self.performance_metrics
@@ -1,6 +1,34 @@
 import time
 import random
+import threading
+from datetime import datetime
 from utils.file_utils import update_performance_metric
+from utils.answer_memory import AnswerMemory
+from utils.encoding import ENCODING_CHOICES
+from utils.shared import get_shared
+
+PRIORITY_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+# Earliest pipeline stage whose output changes when an issue is answered, later answers only redo the transform
+ANSWER_STAGES = {
+    "Encoding issues detected": "parse",
+    "Unexpected file structure": "parse"
+}
+
+# Stored-answer lookups, counted for the process rather than per agent, see _answer_metrics
+INITIAL_ANSWER_METRICS = {
+    "answer_lookups": 0,
+    "answers_reused": 0,
+    "answer_hit_rate": 0.0
+}
+
+def _answer_metrics():
+    """Process-wide stored-answer metrics and the lock that guards them"""
+    return get_shared("answer_metrics", None, lambda: (dict(INITIAL_ANSWER_METRICS), threading.Lock()))
+
+def _question_key(question):
+    """Wording of a question with case and whitespace normalized, identical questions share a key"""
+    return " ".join(question["question"].lower().split())
 
 class QuestionAgent:
     """
@@ -15,13 +43,25 @@ class QuestionAgent:
             "avg_processing_time": 0.8,  # seconds
             "questions_generated": 0,
             "response_rate": 0.85,
-            "question_quality": 0.92
+            "question_quality": 0.92,
+            "digests_sent": 0,
+            "questions_deduplicated": 0
         }
+        
+        # Answers given to earlier questions, reused when the same issue comes back
+        self.answer_memory = AnswerMemory()
+        
+        # Questions are held back this long to be merged with other files from the same sender
+        self.batch_window = 15 * 60  # seconds
     
     def generate_questions(self, validation_result):
         """
         Generates clarifying questions based on validation issues.
         
+        Issues the sender already answered before are resolved with the stored
+        answer instead of being asked again; they are listed in the
+        validation result under "auto_resolved".
+        
         Args:
             validation_result (dict): Results from the validation agent
             
@@ -34,12 +74,21 @@ class QuestionAgent:
         
         questions = []
         file_info = validation_result["file_info"]
+        auto_resolved = []
         
         # Generate questions based on issues
         for issue in validation_result.get("issues", []):
+            issue = self._apply_stored_answers(issue, file_info["sender"], auto_resolved)
+            if issue is None:
+                continue
+            first_question = len(questions)
+            
             if issue["type"] == "Missing required fields":
-                fields = ["customer_id", "transaction_date", "amount", "product_code"]
-                field = random.choice(fields)
+                if issue.get("columns"):
+                    field = ", ".join(issue["columns"])
+                else:
+                    fields = ["customer_id", "transaction_date", "amount", "product_code"]
+                    field = random.choice(fields)
                 questions.append({
                     "question": f"The {field} field appears to be missing in some records. Is this expected or should we use a default value?",
                     "context": f"Issue detected in {file_info['filename']}",
@@ -82,8 +131,9 @@ class QuestionAgent:
                 })
                 
             elif issue["type"] == "Invalid values in numeric fields":
+                fields = f" ({', '.join(issue['columns'])})" if issue.get("columns") else ""
                 questions.append({
-                    "question": "Some numeric fields contain non-numeric values. Should we convert these to zero, null, or exclude these records?",
+                    "question": f"Some numeric fields{fields} contain non-numeric values. Should we convert these to zero, null, or exclude these records?",
                     "context": f"Issue detected in {file_info['filename']}",
                     "priority": "high",
                     "sender": file_info["sender"]
@@ -97,13 +147,40 @@ class QuestionAgent:
                     "sender": file_info["sender"]
                 })
                 
+            elif issue["type"] == "Suspicious outlier values":
+                questions.append({
+                    "question": f"Some values in the {', '.join(issue.get('columns', ['numeric']))} column are far outside the range of your previous submissions. Can you confirm they are correct?",
+                    "context": f"Issue detected in {file_info['filename']}",
+                    "priority": issue["severity"],
+                    "sender": file_info["sender"]
+                })
+                
+            elif issue["type"] in ("Unknown product codes", "Unknown customer IDs", "Unknown policy numbers"):
+                questions.append({
+                    "question": f"Some values in the {', '.join(issue.get('columns', ['identifier']))} column do not match our reference data. Are these new entries, or should they be corrected?",
+                    "context": f"Issue detected in {file_info['filename']}",
+                    "priority": issue["severity"],
+                    "sender": file_info["sender"]
+                })
+                
             elif issue["type"] == "Encoding issues detected":
+                # The answer picks the codec the file is decoded with again, so it is a choice, not free text
+                detected = (validation_result.get("encoding") or {}).get("codec")
                 questions.append({
-                    "question": "We detected character encoding issues in the file. Should we proceed with UTF-8 encoding or maintain the original encoding?",
+                    "question": "We detected character encoding issues in the file. Which encoding does your system export files in?",
                     "context": f"Issue detected in {file_info['filename']}",
                     "priority": "medium",
-                    "sender": file_info["sender"]
+                    "sender": file_info["sender"],
+                    "options": sorted(ENCODING_CHOICES, key=lambda codec: codec != detected),
+                    "option_labels": ENCODING_CHOICES
                 })
+            
+            # Tag the questions so that the answer can be remembered for this issue
+            for question in questions[first_question:]:
+                question["issue_type"] = issue["type"]
+                question["columns"] = list(issue.get("columns", {}))
+        
+        validation_result["auto_resolved"] = auto_resolved
         
         # Update performance metrics
         self.performance_metrics["questions_generated"] += len(questions)
@@ -115,6 +192,158 @@ class QuestionAgent:
         
         return questions
     
+    def record_answer(self, sender, question, answer):
+        """
+        Remembers a sender's answer so the same issue is resolved automatically next time.
+        
+        Args:
+            sender (str): Sender who answered
+            question (dict): Question as returned by generate_questions
+            answer (str): The answer given
+        """
+        if not question.get("issue_type"):
+            return
+        for column in question.get("columns") or [""]:
+            self.answer_memory.remember(sender, question["issue_type"], column, answer)
+    
+    def affected_stage(self, question):
+        """Returns the earliest pipeline stage that has to run again after a question is answered"""
+        return ANSWER_STAGES.get(question.get("issue_type"), "transform")
+    
+    def _apply_stored_answers(self, issue, sender, auto_resolved):
+        """
+        Resolve the parts of an issue that already have a stored answer.
+        
+        Returns:
+            dict or None: The issue limited to its unanswered columns, or None if it is fully answered
+        """
+        if issue.get("error"):
+            # A stored answer cannot make an unreadable file readable, the sender has to be asked
+            return issue
+        columns = list(issue.get("columns") or [""])
+        unanswered = []
+        for column in columns:
+            answer = self.answer_memory.lookup(sender, issue["type"], column)
+            if answer is None:
+                unanswered.append(column)
+            else:
+                auto_resolved.append({"issue_type": issue["type"], "column": column, "answer": answer})
+        
+        metrics, lock = _answer_metrics()
+        with lock:
+            metrics["answer_lookups"] += len(columns)
+            metrics["answers_reused"] += len(columns) - len(unanswered)
+            metrics["answer_hit_rate"] = metrics["answers_reused"] / metrics["answer_lookups"]
+        
+        if not unanswered:
+            return None
+        if len(unanswered) < len(columns):
+            issue = dict(issue)
+            issue["columns"] = {column: issue["columns"][column] for column in unanswered}
+        return issue
+    
+    def questions_answered_together(self, questions_asked, question_set, question):
+        """
+        Finds every open question an answer covers.
+        
+        A question merged into a digest was asked once for all the files it
+        concerns, so its answer applies to the same question of each file in
+        that digest.
+        
+        Args:
+            questions_asked (list): Question sets per file
+            question_set (dict): Question set of the file the answer was given for
+            question (dict): The question answered
+            
+        Returns:
+            list: (question set, question) pairs still without an answer, starting with the one answered
+        """
+        covered = [(question_set, question)]
+        if question_set.get("digest_id") is None:
+            return covered
+        key = _question_key(question)
+        for other_set in questions_asked:
+            if other_set is question_set or other_set.get("digest_id") != question_set["digest_id"]:
+                continue
+            for other in other_set["questions"]:
+                if "answer" not in other and _question_key(other) == key:
+                    covered.append((other_set, other))
+        return covered
+    
+    def build_digests(self, questions_asked, open_senders=(), now=None):
+        """
+        Merges pending question sets into one clarification digest per sender.
+        
+        A sender's digest goes out once none of its files are still queued for
+        processing, or once its oldest pending questions have waited for the
+        batching window. Identical questions asked about several files are
+        asked only once, listing all the files they concern.
+        
+        Args:
+            questions_asked (list): Question sets per file; sets that go into a digest are marked with its id
+            open_senders (set): Senders that still have files waiting to be processed
+            now (datetime): Current time, defaults to datetime.now()
+            
+        Returns:
+            list: New digests, one per sender whose batching window closed
+        """
+        now = now or datetime.now()
+        
+        # Group the question sets that have not been sent yet by sender
+        pending = {}
+        for question_set in questions_asked:
+            if question_set.get("digest_id") is None and question_set["questions"]:
+                pending.setdefault(question_set["sender"], []).append(question_set)
+        
+        digests = []
+        for sender, question_sets in pending.items():
+            oldest = min(question_set["timestamp"] for question_set in question_sets)
+            if sender in open_senders and (now - oldest).total_seconds() < self.batch_window:
+                continue
+            
+            self.performance_metrics["digests_sent"] += 1
+            digest_id = f"digest_{self.performance_metrics['digests_sent']}_{now.strftime('%H%M%S%f')}"
+            
+            # Dedupe identical questions across files, keeping the highest priority
+            merged = {}
+            for question_set in question_sets:
+                question_set["digest_id"] = digest_id
+                for question in question_set["questions"]:
+                    key = _question_key(question)
+                    if key in merged:
+                        self.performance_metrics["questions_deduplicated"] += 1
+                        entry = merged[key]
+                        if PRIORITY_ORDER.get(question["priority"], 0) > PRIORITY_ORDER.get(entry["priority"], 0):
+                            entry["priority"] = question["priority"]
+                    else:
+                        entry = merged[key] = {
+                            "question": question["question"],
+                            "priority": question["priority"],
+                            "files": [],
+                            "example_ids": []
+                        }
+                    if question_set["example_id"] not in entry["example_ids"]:
+                        entry["example_ids"].append(question_set["example_id"])
+                        entry["files"].append(question_set.get("filename", question_set["example_id"]))
+            
+            questions = sorted(merged.values(), key=lambda q: -PRIORITY_ORDER.get(q["priority"], 0))
+            for question in questions:
+                question["context"] = f"Issue detected in {', '.join(question['files'])}"
+            
+            digests.append({
+                "digest_id": digest_id,
+                "sender": sender,
+                "example_ids": [question_set["example_id"] for question_set in question_sets],
+                "questions": questions,
+                "answered": False,
+                "timestamp": now
+            })
+        
+        return digests
+    
     def get_performance_stats(self):
-        """Returns the current performance metrics for this agent"""
-        return self.performance_metrics
+        """Returns the current performance metrics for this agent, with those of the stored-answer lookups so far"""
+        metrics, lock = _answer_metrics()
+        with lock:
+            answer_metrics = dict(metrics)
+        return dict(self.performance_metrics, **answer_metrics)
@@ -28,13 +28,15 @@ class TransformationAgent:
             "pdf": self._process_pdf
         }
     
-    def transform_data(self, file_info, validation_result):
+    def transform_data(self, file_info, validation_result, parked_rows=None, only_rows=None):
         """
         Transforms file data into a common structure.
         
         Args:
             file_info (dict): Information about the file to transform
             validation_result (dict): Results from the validation agent
+            parked_rows (list): Rows held back until open questions are answered
+            only_rows (list): Transform only these rows, e.g. a parked slice once its answers arrived
             
         Returns:
             dict: Transformed data in a common structure
@@ -43,6 +45,10 @@ class TransformationAgent:
         complexity_factor = {"low": 1.0, "medium": 2.0, "high": 3.5}
         base_time = random.uniform(1.0, 2.0)
         processing_time = base_time * complexity_factor.get(file_info["complexity"], 1.0)
+        near_duplicate = validation_result.get("near_duplicate")
+        if near_duplicate:
+            # Only the changed share of a near-duplicate is reprocessed
+            processing_time *= max(0.05, 1.0 - near_duplicate["similarity"])
         time.sleep(0.1)  # Just a small delay for demo purposes
         
         # Update performance metrics
@@ -57,17 +63,82 @@ class TransformationAgent:
         file_size = random.randint(10, 100) * complexity_factor.get(file_info["complexity"], 1.0) * 1024  # in bytes
         self.performance_metrics["bytes_processed"] += file_size
         
-        # Process the file based on its type
+        # Near-duplicates of a recent submission only need their changed rows processed
         file_type = file_info["file_type"].lower()
-        processor = self.processors.get(file_type, self._process_unknown)
+        if near_duplicate:
+            processor = self._process_delta
+        else:
+            processor = self.processors.get(file_type, self._process_unknown)
         
         # Call the appropriate processor
         transformed_data = processor(file_info, validation_result)
         transformed_data["processing_time"] = processing_time
         transformed_data["file_size"] = file_size
         
+        # Compressed inputs are read through a decompressing stream, never unpacked to disk
+        if file_info.get("compression"):
+            transformed_data["transformation_steps"] = [f"Streaming {file_info['compression']} decompression"] + \
+                transformed_data.get("transformation_steps", [])
+        
+        # Rows of the source file the upload reads, and how to decode them
+        transformed_data["encoding"] = (validation_result.get("encoding") or {}).get("codec")
+        if only_rows is not None:
+            transformed_data["row_selection"] = {"only": list(only_rows)}
+        elif near_duplicate:
+            parked = set(parked_rows or [])
+            transformed_data["row_selection"] = {"only": [row for row in near_duplicate["changed_rows"] if row not in parked]}
+        elif parked_rows:
+            transformed_data["row_selection"] = {"exclude": list(parked_rows)}
+        
+        # Leave out the parked rows, or keep only the requested slice
+        if only_rows is not None:
+            transformed_data["record_count"] = len(only_rows)
+            transformed_data["transformation_steps"] = [f"Reprocessed {len(only_rows)} parked rows"] + \
+                transformed_data.get("transformation_steps", [])
+        elif parked_rows:
+            parked_count = min(len(parked_rows), transformed_data.get("record_count", len(parked_rows)))
+            transformed_data["record_count"] = transformed_data.get("record_count", 0) - parked_count
+            transformed_data["parked_rows"] = parked_count
+            transformed_data.setdefault("transformation_steps", []).append(
+                f"Parked {parked_count} rows awaiting clarification"
+            )
+        
+        # Issues resolved from remembered answers are applied as extra steps
+        for resolution in validation_result.get("auto_resolved", []):
+            column = f" in {resolution['column']}" if resolution["column"] else ""
+            transformed_data.setdefault("transformation_steps", []).append(
+                f"{resolution['issue_type']}{column}: {resolution['answer']} (remembered answer)"
+            )
+        
         return transformed_data
     
+    def split_parked_rows(self, validation_result, questions):
+        """
+        Works out which rows have to wait for the answers to open questions.
+        
+        Only rows flagged by the issues behind the questions are parked, so
+        the rest of the file can be transformed and uploaded right away.
+        
+        Args:
+            validation_result (dict): Results from the validation agent
+            questions (list): Open questions, as returned by QuestionAgent.generate_questions
+            
+        Returns:
+            list or None: Sorted positions of the parked rows, or None if the issues do not
+                identify rows and the whole file has to wait
+        """
+        parked = set()
+        for question in questions:
+            issue = next((i for i in validation_result.get("issues", []) if i["type"] == question.get("issue_type")), None)
+            if issue is None or "rows" not in issue:
+                return None
+            if isinstance(issue["rows"], dict):
+                for column in question.get("columns") or issue["rows"]:
+                    parked.update(issue["rows"].get(column, []))
+            else:
+                parked.update(issue["rows"])
+        return sorted(parked)
+    
     def _process_csv(self, file_info, validation_result):
         """Process CSV files"""
         # Simulate CSV processing
@@ -185,6 +256,27 @@ class TransformationAgent:
             "format": "pdf"
         }
     
+    def _process_delta(self, file_info, validation_result):
+        """Process only the rows that changed since a near-duplicate earlier submission"""
+        near_duplicate = validation_result["near_duplicate"]
+        return {
+            "file_info": file_info,
+            "data_format": "tabular",
+            "record_count": len(near_duplicate["changed_rows"]),
+            "changed_rows": near_duplicate["changed_rows"],
+            "delta_of": near_duplicate["previous_filename"],
+            "schema": self._generate_schema("tabular"),
+            "sample_data": self._generate_sample_data("tabular"),
+            "transformation_steps": [
+                f"Delta against {near_duplicate['previous_filename']} ({near_duplicate['similarity']:.0%} similar)",
+                f"Skipped {near_duplicate['unchanged_count']} unchanged rows",
+                "Header normalization",
+                "Data type conversion"
+            ],
+            "issues_resolved": len(validation_result.get("issues", [])),
+            "format": file_info["file_type"].lower()
+        }
+    
     def _process_unknown(self, file_info, validation_result):
         """Process unknown file types"""
         return {
@@ -1,60 +1,145 @@
 import time
+import uuid
 import random
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.file_utils import load_tabular_data
+from utils.warehouse import WarehouseLoader
+from utils.connection_pool import get_pool
+from utils.system_clients import SimulatedSystemConnection
+from utils.latency_tracker import get_tracker
+from utils.retry import backoff_delay, MAX_RETRIES
+from utils.outbox import UploadOutbox, get_relay
+from utils.shared import get_shared
+
+# Rows per executemany batch and transaction when loading the warehouse
+WAREHOUSE_BATCH_SIZE = 5000
+
+# Connections kept open per target system, shared by all files and worker threads
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 4
+
+# Records per request to a core system, the unit that is acknowledged and resumed from
+UPLOAD_BATCH_SIZE = 50000
+
+# Seconds a target system may take before the relay moves on and retries it later
+DEFAULT_UPLOAD_TIMEOUT = 5.0
+
+# Metrics of the deliveries made by the outbox relay, kept with the relay rather than on an agent
+INITIAL_DELIVERY_METRICS = {
+    "records_stored": 0,
+    "storage_success_rate": 0.995,
+    "warehouse_rows_loaded": 0,
+    "warehouse_rows_per_second": 0.0,
+    "connections_opened": 0,
+    "connections_reused": 0,
+    "upload_timeouts": 0,
+    "upload_retries": 0,
+    "system_uploads": 0,
+    "system_upload_failures": 0,
+    "hedged_requests": 0,
+    "hedges_won": 0,
+    "budget_misses": 0,
+    "last_upload_latency": 0.0
+}
+
+def _delivery_metrics():
+    """Process-wide delivery metrics and the lock that guards them"""
+    return get_shared("delivery_metrics", None, lambda: (dict(INITIAL_DELIVERY_METRICS), threading.Lock()))
 
 class UploadAgent:
     """
     Agent responsible for uploading transformed data into the appropriate systems.
     """
     
-    def __init__(self):
+    def __init__(self, warehouse_batch_size=WAREHOUSE_BATCH_SIZE, upload_timeout=DEFAULT_UPLOAD_TIMEOUT):
         self.name = "Upload Agent"
         self.description = "Uploads transformed data into core systems and data warehouse"
         self.capabilities = ["Data warehouse integration", "Core system integration", "Data validation", "Schema mapping"]
         self.performance_metrics = {
             "avg_processing_time": 1.8,  # seconds
-            "records_stored": 0,
-            "storage_success_rate": 0.995,
-            "bytes_stored": 0
+            "bytes_stored": 0,
+            "loads_queued": 0
         }
         
+        # Local stand-in for the data warehouse, loaded with the actual rows of tabular files
+        self.warehouse = WarehouseLoader(batch_size=warehouse_batch_size)
+        
         # Define target systems
         self.target_systems = [
             {
                 "name": "Data Warehouse",
                 "type": "warehouse",
                 "status": "online",
-                "latency": 0.8  # seconds
+                "latency": 0.8,  # seconds
+                "connect_latency": 0.5,  # seconds, handshake and authentication
+                "latency_budget": 2.0,  # seconds
+                "timeout": upload_timeout  # seconds
             },
             {
                 "name": "Claims Processing System",
                 "type": "core",
                 "status": "online",
-                "latency": 0.5  # seconds
+                "latency": 0.5,  # seconds
+                "connect_latency": 0.3,  # seconds
+                "latency_budget": 1.2,  # seconds
+                "timeout": upload_timeout  # seconds
             },
             {
                 "name": "Policy Management System",
                 "type": "core",
                 "status": "online",
-                "latency": 0.6  # seconds
+                "latency": 0.6,  # seconds
+                "connect_latency": 0.35,  # seconds
+                "latency_budget": 1.4,  # seconds
+                "timeout": upload_timeout  # seconds
             },
             {
                 "name": "Customer Relationship Management",
                 "type": "core",
                 "status": "online",
-                "latency": 0.7  # seconds
+                "latency": 0.7,  # seconds
+                "connect_latency": 0.45,  # seconds
+                "latency_budget": 1.6,  # seconds
+                "timeout": upload_timeout  # seconds
             }
         ]
+        
+        # Process-wide pools, so the handshake is paid once per connection rather than once per file
+        self.pools = {
+            system["name"]: get_pool(
+                system["name"],
+                connect=lambda system=system: SimulatedSystemConnection(system),
+                min_size=MIN_CONNECTIONS,
+                max_size=MAX_CONNECTIONS,
+                health_check=lambda connection: connection.ping()
+            )
+            for system in self.target_systems
+        }
+        
+        # Recent latencies of each system, the hedging decisions are based on them
+        self.latency_trackers = {system["name"]: get_tracker(system["name"]) for system in self.target_systems}
+        
+        # Loads are written here before they are sent, the process-wide relay delivers them
+        self.outbox = UploadOutbox()
+        self.relay = get_relay(self.outbox, self.deliver)
     
-    def store_data(self, transformed_data):
+    def store_data(self, transformed_data, file_id=None, frame=None):
         """
-        Uploads transformed data into appropriate systems.
+        Queues transformed data for upload into appropriate systems.
+        
+        The load is written to the outbox, rows included, before anything
+        is sent, and the relay delivers it in the background. Once this
+        returns the upload survives a restart of the process.
         
         Args:
             transformed_data (dict): Data that has been transformed into a common structure
+            file_id (str): ID of the file in the pipeline, shown with its deliveries
+            frame (pd.DataFrame): The file already parsed with the encoding of transformed_data, read again if None
             
         Returns:
-            dict: Results of the upload operation
+            dict: Results of the upload operation, one queued delivery per target system
         """
         # Simulate processing time
         processing_time = random.uniform(1.0, 3.0)
@@ -64,8 +149,6 @@ class UploadAgent:
         file_info = transformed_data["file_info"]
         target_systems = self._determine_target_systems(file_info)
         
-        # Simulate uploading data to each target system
-        storage_results = []
         total_records = transformed_data.get("record_count", 0)
         if total_records == 0:
             # For non-tabular data, estimate record count
@@ -74,26 +157,31 @@ class UploadAgent:
             elif transformed_data.get("data_format") == "document":
                 total_records = random.randint(10, 100)  # Estimate for documents
         
-        for system in target_systems:
-            # Simulate system latency
-            system_latency = system["latency"] * random.uniform(0.8, 1.2)
-            
-            # Simulate success rate
-            success = random.random() < self.performance_metrics["storage_success_rate"]
-            
-            # Calculate records stored in this system
-            records_stored = total_records if success else int(total_records * random.uniform(0.5, 0.95))
-            
-            storage_results.append({
+        # Files with readable rows are loaded for real, counting the rows that are actually there
+        records = self._common_format_records(transformed_data, frame)
+        if records is not None:
+            total_records = records[0]
+        
+        # Requests to the systems carry idempotency keys derived from this, so a duplicate is applied once
+        load_id = uuid.uuid4().hex
+        delivery_ids = self.outbox.enqueue(
+            load_id, file_id, file_info["filename"], file_info["sender"],
+            [system["name"] for system in target_systems], total_records,
+            records[1] if records is not None else None
+        )
+        self.relay.notify()
+        self.performance_metrics["loads_queued"] += 1
+        
+        storage_results = [
+            {
                 "system": system["name"],
-                "success": success,
-                "records_stored": records_stored,
-                "latency": system_latency,
+                "status": "queued",
+                "delivery_id": delivery_id,
+                "idempotency_key": f"{load_id}:{system['name']}",
                 "timestamp": time.time()
-            })
-            
-            # Update metrics
-            self.performance_metrics["records_stored"] += records_stored
+            }
+            for system, delivery_id in zip(target_systems, delivery_ids)
+        ]
         
         # Update performance metrics
         self.performance_metrics["avg_processing_time"] = (
@@ -109,16 +197,294 @@ class UploadAgent:
         # Generate upload result
         storage_result = {
             "file_info": file_info,
+            "load_id": load_id,
             "target_systems": target_systems,
             "storage_results": storage_results,
             "total_records": total_records,
             "bytes_stored": bytes_stored,
             "processing_time": processing_time,
-            "overall_success": all(result["success"] for result in storage_results)
+            "queued": True
         }
         
         return storage_result
     
+    def deliver(self, deliveries):
+        """
+        Delivers a batch of outbox deliveries, called by the outbox relay.
+        
+        The deliveries of one load go to all their target systems at once,
+        so a load waits for its slowest system instead of the sum, and a
+        system that misses its timeout or fails is left for a later attempt
+        without failing the other deliveries of the batch.
+        
+        Args:
+            deliveries (list): Due deliveries, from UploadOutbox.take_pending
+            
+        Returns:
+            list: (delivery ID, result, delivered) per delivery
+        """
+        systems = {system["name"]: system for system in self.target_systems}
+        loads = {}
+        for delivery in deliveries:
+            loads.setdefault(delivery["load_id"], []).append(delivery)
+        
+        outcomes = []
+        for load_id, load_deliveries in loads.items():
+            load = load_deliveries[0]
+            records = self.outbox.records(load_id) if load["has_rows"] else None
+            
+            upload_start = time.perf_counter()
+            executor = ThreadPoolExecutor(max_workers=len(load_deliveries), thread_name_prefix="upload")
+            try:
+                pending = {
+                    executor.submit(
+                        self._upload_to_system, load_id, systems[delivery["system"]],
+                        load["filename"], load["sender"], load["total_records"], records
+                    ): delivery
+                    for delivery in load_deliveries
+                }
+                deadlines = {future: upload_start + systems[delivery["system"]]["timeout"] for future, delivery in pending.items()}
+                while pending:
+                    next_deadline = min(deadlines[future] for future in pending)
+                    wait(pending, timeout=max(0.0, next_deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+                    now = time.perf_counter()
+                    for future in list(pending):
+                        delivery = pending[future]
+                        system = systems[delivery["system"]]
+                        if future.done():
+                            try:
+                                result = future.result()
+                            except Exception as e:
+                                result = self._failed_result(system, now - upload_start, error=str(e))
+                        elif now >= deadlines[future]:
+                            # A slow system does not hold the batch, the request finishes in the background
+                            future.cancel()
+                            result = self._failed_result(system, now - upload_start, timed_out=True)
+                        else:
+                            continue
+                        del pending[future]
+                        self._record_result(result)
+                        outcomes.append((delivery["delivery_id"], result, result["success"]))
+            finally:
+                executor.shutdown(wait=False)
+            metrics, lock = _delivery_metrics()
+            with lock:
+                metrics["last_upload_latency"] = time.perf_counter() - upload_start
+        return outcomes
+    
+    def _failed_result(self, system, latency, timed_out=False, error=None):
+        """Result of a delivery to a system that timed out or raised"""
+        result = {
+            "system": system["name"],
+            "success": False,
+            "records_stored": 0,
+            "latency": latency,
+            "latency_budget": system["latency_budget"],
+            "within_budget": False,
+            "timed_out": timed_out,
+            "timestamp": time.time()
+        }
+        if error is not None:
+            result["error"] = error
+        return result
+    
+    def delivered_since(self, since):
+        """Returns the deliveries the relay confirmed or gave up after a Unix timestamp, oldest first"""
+        return self.outbox.settled_since(since)
+    
+    def _upload_to_system(self, load_id, system, filename, sender, total_records, records):
+        """
+        Uploads one file to one target system, run on a worker thread.
+        
+        Records go to core systems in batches of UPLOAD_BATCH_SIZE, each
+        identified by the upload's idempotency key and its offset. A batch is
+        hedged: if the first attempt is still running after the system's p95
+        latency, a second attempt is sent on another connection and the first
+        response wins. A transient failure is retried with jittered
+        exponential backoff, resuming from the offset the system last
+        acknowledged, so only the missing tail is sent again. The warehouse
+        load is a local bulk write and is not hedged.
+        
+        Args:
+            load_id (str): Identifier of this upload
+            system (dict): Target system
+            filename (str): Source file name
+            sender (str): Sender of the source file
+            total_records (int): Number of records in the file
+            records (iterable or None): (row number, JSON document) pairs, None if the file has no readable rows
+            
+        Returns:
+            dict: Result of the upload to this system
+        """
+        if system["type"] == "warehouse" and records is not None:
+            load = self.warehouse.load(load_id, filename, sender, records)
+            self.latency_trackers[system["name"]].record(load["seconds"])
+            return {
+                "system": system["name"],
+                "success": True,
+                "records_stored": load["rows"],
+                "latency": load["seconds"],
+                "latency_budget": system["latency_budget"],
+                "within_budget": load["seconds"] <= system["latency_budget"],
+                "rows_per_second": load["rows_per_second"],
+                "batches": load["batches"],
+                "retries": load["retries"],
+                "timestamp": time.time()
+            }
+        
+        start_time = time.perf_counter()
+        upload_key = f"{load_id}:{system['name']}"
+        offset = 0
+        failures = 0  # Consecutive failed attempts
+        retries = 0
+        requests = []
+        while offset < total_records:
+            try:
+                if failures:
+                    # Resume from what the system acknowledged, a lost acknowledgement may hide an applied batch
+                    offset = self._committed_offset(system, upload_key)
+                    if offset >= total_records:
+                        break
+                batch_size = min(UPLOAD_BATCH_SIZE, total_records - offset)
+                request = self._send_hedged(system, upload_key, offset, batch_size)
+                requests.append(request)
+                offset = request["committed_offset"]
+                failures = 0
+            except (ConnectionError, TimeoutError):
+                # A dropped request, or no pooled connection free in time
+                if failures == MAX_RETRIES:
+                    break
+                time.sleep(backoff_delay(failures))
+                failures += 1
+                retries += 1
+        system_latency = time.perf_counter() - start_time
+        success = offset >= total_records
+        connections_opened = sum(not request["connection_reused"] for request in requests)
+        
+        result = {
+            "system": system["name"],
+            "success": success,
+            "records_stored": min(offset, total_records),
+            "latency": system_latency,
+            "latency_budget": system["latency_budget"],
+            "within_budget": system_latency <= system["latency_budget"],
+            "idempotency_key": upload_key,
+            "batches": len(requests),
+            "retries": retries,
+            "hedged": sum(request["hedged"] for request in requests),
+            "hedges_won": sum(request["hedge_won"] for request in requests),
+            "connect_time": connections_opened * system["connect_latency"],
+            "connections_opened": connections_opened,
+            "connection_reused": connections_opened == 0,
+            "timestamp": time.time()
+        }
+        if not success:
+            # A later upload with the same key sends only the records from here on
+            result["resume_offset"] = offset
+        return result
+    
+    def _hedge_delay(self, system):
+        """
+        Seconds to wait for the first attempt before hedging.
+        
+        This is the system's observed p95, so about one request in twenty is
+        duplicated, but never so late that a hedge taking the median latency
+        would miss the latency budget. Until enough latencies were seen the
+        configured latency stands in for them.
+        """
+        tracker = self.latency_trackers[system["name"]]
+        p95 = tracker.percentile(95, default=system["latency"] * 1.5)
+        p50 = tracker.percentile(50, default=system["latency"])
+        return max(0.0, min(p95, system["latency_budget"] - p50))
+    
+    def _send_hedged(self, system, upload_key, offset, record_count):
+        """
+        Sends one batch, hedged with a second attempt if the first is slower than the system's p95.
+        
+        Returns:
+            dict: Response of the first successful attempt, with hedged and hedge_won
+            
+        Raises:
+            ConnectionError: If every attempt failed
+        """
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+        try:
+            attempts = [executor.submit(self._send, system, upload_key, offset, record_count)]
+            pending, _ = wait(attempts, timeout=self._hedge_delay(system))
+            if not pending:
+                attempts.append(executor.submit(self._send, system, upload_key, offset, record_count))
+            pending = set(attempts)
+            while True:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return dict(attempt.result(), hedged=len(attempts) > 1, hedge_won=attempt is not attempts[0])
+                if not pending:
+                    raise done.pop().exception()
+        finally:
+            # A losing attempt finishes in the background, the system ignores it by its key
+            executor.shutdown(wait=False)
+    
+    def _send(self, system, upload_key, offset, record_count):
+        """Sends one attempt over a pooled connection and records its latency"""
+        with self.pools[system["name"]].connection() as connection:
+            # Only a connection's first request pays for the handshake, later files reuse it
+            reused = connection.uses > 0
+            response = connection.raw.send_batch(upload_key, offset, record_count)
+        self.latency_trackers[system["name"]].record(response["latency"])
+        return dict(response, connection_reused=reused)
+    
+    def _committed_offset(self, system, upload_key):
+        """Asks the system how many records of an upload it has acknowledged"""
+        with self.pools[system["name"]].connection() as connection:
+            return connection.raw.committed_offset(upload_key)
+    
+    def _record_result(self, result):
+        """Updates the process-wide delivery metrics with the result of one target system"""
+        metrics, lock = _delivery_metrics()
+        with lock:
+            metrics["records_stored"] += result["records_stored"]
+            if "rows_per_second" in result:
+                metrics["warehouse_rows_loaded"] += result["records_stored"]
+                metrics["warehouse_rows_per_second"] = result["rows_per_second"]
+            metrics["system_uploads"] += 1
+            metrics["system_upload_failures"] += not result["success"]
+            metrics["storage_success_rate"] = 1 - metrics["system_upload_failures"] / metrics["system_uploads"]
+            metrics["upload_timeouts"] += result.get("timed_out", False)
+            metrics["hedged_requests"] += result.get("hedged", 0)
+            metrics["hedges_won"] += result.get("hedges_won", 0)
+            metrics["upload_retries"] += result.get("retries", 0)
+            if not result.get("within_budget", True):
+                metrics["budget_misses"] += 1
+            if "connections_opened" in result:
+                metrics["connections_opened"] += result["connections_opened"]
+                metrics["connections_reused"] += result["batches"] - result["connections_opened"]
+    
+    def _common_format_records(self, transformed_data, frame=None):
+        """
+        Reads the rows of a transformed tabular file in the common format.
+        
+        Args:
+            transformed_data (dict): Data that has been transformed into a common structure
+            frame (pd.DataFrame): The whole file already parsed, read from the file if None
+            
+        Returns:
+            tuple or None: (row count, iterator of (row number, JSON document)), or None if the file has no readable rows
+        """
+        df = frame if frame is not None else load_tabular_data(transformed_data["file_info"], encoding=transformed_data.get("encoding"))
+        if df is None:
+            return None
+        
+        # Keep only the rows this upload covers, numbered by their position in the file
+        selection = transformed_data.get("row_selection") or {}
+        if "only" in selection:
+            df = df.iloc[[row for row in selection["only"] if row < len(df)]]
+        elif "exclude" in selection:
+            df = df.drop(index=df.index[[row for row in selection["exclude"] if row < len(df)]])
+        
+        documents = df.to_json(orient="records", lines=True, date_format="iso").splitlines() if len(df) else []
+        return len(df), zip(df.index.tolist(), documents)
+    
     def _determine_target_systems(self, file_info):
         """Determine which systems should receive this data"""
         # Select systems based on file content and type
@@ -149,5 +515,13 @@ class UploadAgent:
         return selected_systems
     
     def get_performance_stats(self):
-        """Returns the current performance metrics for this agent"""
-        return self.performance_metrics
+        """Returns the current performance metrics for this agent, with those of the deliveries made so far"""
+        metrics, lock = _delivery_metrics()
+        with lock:
+            delivery_metrics = dict(metrics)
+        outbox_stats = {f"outbox_{status}": count for status, count in self.outbox.stats().items()}
+        return dict(self.performance_metrics, **delivery_metrics, **outbox_stats)
+    
+    def get_latency_distributions(self):
+        """Returns the request count and the p50, p95 and p99 latency of each target system"""
+        return {name: tracker.summary() for name, tracker in self.latency_trackers.items()}
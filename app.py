@@ -10,7 +10,7 @@ from agents.validation_agent import ValidationAgent
 from agents.question_agent import QuestionAgent
 from agents.transformation_agent import TransformationAgent
 from agents.upload_agent import UploadAgent
-from utils.file_utils import load_example_files, get_example_metadata
+from utils.file_utils import load_example_files, get_example_metadata, load_tabular_data
 from ui.dashboard import render_dashboard, render_agent_details, render_file_details
 from ui.sidebar import render_sidebar
 
@@ -35,8 +35,18 @@ if 'selected_example' not in st.session_state:
     st.session_state.selected_example = None
 if 'process_queue' not in st.session_state:
     st.session_state.process_queue = []
+if 'parked_slices' not in st.session_state:
+    st.session_state.parked_slices = {}
+if 'answer_queue' not in st.session_state:
+    st.session_state.answer_queue = []
+if 'clarification_digests' not in st.session_state:
+    st.session_state.clarification_digests = []
+if 'validation_results' not in st.session_state:
+    st.session_state.validation_results = {}
 if 'examples_metadata' not in st.session_state:
     st.session_state.examples_metadata = get_example_metadata()
+if 'delivery_log_time' not in st.session_state:
+    st.session_state.delivery_log_time = time.time()
 
 # Initialize agents
 email_agent = EmailAgent()
@@ -45,6 +55,24 @@ question_agent = QuestionAgent()
 transformation_agent = TransformationAgent()
 upload_agent = UploadAgent()
 
+# Log the uploads the outbox relay delivered, or gave up on, since the last run
+for delivery in upload_agent.delivered_since(st.session_state.delivery_log_time):
+    result = delivery["result"] or {}
+    if delivery["status"] == "delivered":
+        rate_note = f" at {result['rows_per_second']:,.0f} rows/s" if "rows_per_second" in result else ""
+        action = f"Delivered {result.get('records_stored', 0)} records of {delivery['filename']} to {delivery['system']}{rate_note}"
+    else:
+        action = f"Gave up delivering {delivery['filename']} to {delivery['system']} after repeated failures"
+    st.session_state.agent_logs.append({
+        "timestamp": datetime.now(),
+        "agent": "Upload Agent",
+        "action": action,
+        "status": "complete" if delivery["status"] == "delivered" else "error",
+        "duration": result.get("latency", 0.0),
+        "file_id": delivery["file_id"]
+    })
+    st.session_state.delivery_log_time = delivery["updated_at"]
+
 # Force Dava Sans font globally
 st.markdown("""
 <style>
@@ -84,6 +112,137 @@ with tab2:
 with tab3:
     render_file_details()
 
+def parked_frame(parked):
+    """
+    The parsed content of a parked file, parsed on first use and kept in the slice.
+    
+    Every answer uploads some of the parked rows, so the file is parsed once
+    while it is parked instead of once per answer. The frame is dropped
+    with the slice once the last question is answered.
+    """
+    if "frame" not in parked:
+        encoding = (parked["validation_result"].get("encoding") or {}).get("codec")
+        parked["frame"] = load_tabular_data(parked["file_info"], encoding=encoding)
+    return parked["frame"]
+
+def reprocess_after_answer(example_id, file_questions, question):
+    """
+    Re-runs a parked file from the earliest stage the answer affects.
+    
+    Outputs of the earlier stages (email extraction and validation) are
+    reused from the parked slice, and only rows no longer held back by
+    another open question are transformed and uploaded. The upload takes
+    the released rows from the frame kept in the slice, which is parsed
+    again only when the answer changed how the file is decoded.
+    """
+    parked = st.session_state.parked_slices[example_id]
+    stage = question_agent.affected_stage(question)
+    reused = ["email extraction"]
+    
+    if stage == "parse":
+        # Decode the file again with what the sender told us, without receiving it again
+        parked["validation_result"], parked["frame"] = validation_agent.reparse(parked["file_info"], parked["validation_result"], question["answer"])
+        if parked["validation_result"].get("parse_error"):
+            # Nothing of a file that cannot be read is uploaded
+            del st.session_state.parked_slices[example_id]
+            for processed_file in st.session_state.processed_files:
+                if processed_file["example_id"] == example_id:
+                    processed_file["status"] = "Unreadable File"
+            email_agent.record_result(parked["file_info"], example_id, {"status": "Unreadable File", "total_records": 0})
+            st.session_state.agent_logs.append({
+                "timestamp": datetime.now(),
+                "agent": "Validation Agent",
+                "action": f"File still cannot be read after the answer, not uploaded: {parked['validation_result']['parse_error']}",
+                "status": "error",
+                "duration": random.uniform(0.05, 0.2),
+                "file_id": example_id
+            })
+            return
+    else:
+        reused.append("validation")
+    
+    # Rows still needed by other open questions stay parked
+    open_questions = [q for q in file_questions["questions"] if "answer" not in q]
+    still_parked = transformation_agent.split_parked_rows(parked["validation_result"], open_questions) if open_questions else []
+    if still_parked is None:
+        st.session_state.agent_logs.append({
+            "timestamp": datetime.now(),
+            "agent": "Transformation Agent",
+            "action": f"Answer applied from the {stage} stage, {len(open_questions)} questions still open for the whole file",
+            "status": "pending",
+            "duration": random.uniform(0.05, 0.2),
+            "file_id": example_id
+        })
+        return
+    
+    parked_rows = parked["rows"]
+    if parked_rows is None and still_parked:
+        # The whole file was parked, but the remaining questions point at rows
+        parked_rows = list(range(parked["validation_result"]["row_count"]))
+    if parked_rows is None:
+        released = None
+    else:
+        still_parked_set = set(still_parked)
+        released = [row for row in parked_rows if row not in still_parked_set]
+    
+    validation_result = dict(parked["validation_result"])
+    validation_result["auto_resolved"] = validation_result.get("auto_resolved", []) + [
+        {"issue_type": q.get("issue_type", "Clarification"), "column": ", ".join(q.get("columns", [])), "answer": q["answer"]}
+        for q in file_questions["questions"] if "answer" in q
+    ]
+    
+    transformed_data = transformation_agent.transform_data(parked["file_info"], validation_result, only_rows=released)
+    storage_result = upload_agent.store_data(transformed_data, file_id=example_id, frame=parked_frame(parked))
+    
+    if open_questions:
+        parked["rows"] = still_parked
+    else:
+        del st.session_state.parked_slices[example_id]
+        for processed_file in st.session_state.processed_files:
+            if processed_file["example_id"] == example_id:
+                processed_file["status"] = "Processed"
+        email_agent.record_result(parked["file_info"], example_id, {"status": "Processed", "total_records": storage_result["total_records"]})
+    
+    released_part = "whole file" if released is None else f"{len(released)} released rows"
+    st.session_state.agent_logs.append({
+        "timestamp": datetime.now(),
+        "agent": "Upload Agent",
+        "action": f"Reprocessed from the {stage} stage reusing {' and '.join(reused)}: queued {released_part} for upload ({storage_result['total_records']} records)",
+        "status": "complete",
+        "duration": random.uniform(0.3, 1.0),
+        "file_id": example_id
+    })
+
+# Apply responses sent from the File Details tab
+while st.session_state.answer_queue:
+    response = st.session_state.answer_queue.pop(0)
+    file_questions = next((q for q in st.session_state.questions_asked if q["example_id"] == response["example_id"]), None)
+    if file_questions is None:
+        continue
+    question = file_questions["questions"][response["question_index"]]
+    
+    # Remember the answer so the same issue is resolved automatically next time
+    question_agent.record_answer(file_questions["sender"], question, response["answer"])
+    
+    # A digest asks a question once for several files, the answer applies to all of them
+    for answered_set, answered_question in question_agent.questions_answered_together(
+            st.session_state.questions_asked, file_questions, question):
+        answered_question["answer"] = response["answer"]
+        answered_set["answered"] = all("answer" in q for q in answered_set["questions"])
+        
+        st.session_state.agent_logs.append({
+            "timestamp": datetime.now(),
+            "agent": "Question Agent",
+            "action": f"Recorded answer from {answered_set['sender']} about {answered_question.get('issue_type', 'the file')}",
+            "status": "complete",
+            "duration": random.uniform(0.05, 0.2),
+            "file_id": answered_set["example_id"]
+        })
+        
+        # Every answer releases the parked rows that no other open question needs
+        if answered_set["example_id"] in st.session_state.parked_slices:
+            reprocess_after_answer(answered_set["example_id"], answered_set, answered_question)
+
 # Process selected example if any
 if st.session_state.selected_example:
     example_id = st.session_state.selected_example
@@ -110,83 +269,220 @@ if st.session_state.selected_example:
             file_info = email_agent.receive_email(example_data)
             time.sleep(0.5)  # Simulate processing time
             
-            # Track processing stage for visualization
-            if 'file_processing_stages' in st.session_state:
-                st.session_state.file_processing_stages[example_id] = "email"
-            
-            # Validation agent checks the file
-            validation_result = validation_agent.validate_file(file_info)
-            time.sleep(0.5)  # Simulate processing time
-            
-            # Track processing stage for visualization
-            if 'file_processing_stages' in st.session_state:
-                st.session_state.file_processing_stages[example_id] = "validation"
+            if not file_info["sender_verification"]["verified"]:
+                st.session_state.agent_logs.append({
+                    "timestamp": datetime.now(),
+                    "agent": "Email Agent",
+                    "action": f"Could not verify sender {example_data['sender_email']}: {file_info['sender_verification']['reason']}",
+                    "status": "pending",
+                    "duration": random.uniform(0.05, 0.2),
+                    "file_id": example_id
+                })
             
-            # If validation requires questions, ask them
-            if validation_result.get("needs_clarification", False):
-                questions = question_agent.generate_questions(validation_result)
-                st.session_state.questions_asked.append({
+            # Exact duplicates of an earlier attachment return its result instead of being processed again
+            duplicate_of = email_agent.find_duplicate(file_info, example_id)
+            if duplicate_of is not None:
+                st.session_state.agent_logs.append({
+                    "timestamp": datetime.now(),
+                    "agent": "Email Agent",
+                    "action": f"Skipped exact duplicate of {duplicate_of['filename']} ({duplicate_of['file_id']}) from {duplicate_of['sender']}",
+                    "status": "complete",
+                    "duration": random.uniform(0.05, 0.2),
+                    "file_id": example_id
+                })
+                st.session_state.processed_files.append({
                     "example_id": example_id,
-                    "questions": questions,
-                    "answered": False,
-                    "timestamp": datetime.now()
+                    "filename": example_data["filename"],
+                    "file_type": example_data["file_type"],
+                    "sender": example_data["sender"],
+                    "subject": example_data["subject"],
+                    "received_time": datetime.now(),
+                    "processing_time": file_info["processing_time"],
+                    "status": duplicate_of["result"]["status"],
+                    "complexity": example_data["complexity"],
+                    "duplicate_of": duplicate_of["file_id"]
                 })
+            elif file_info["file_type"] == "archive":
+                # Each member of an archive goes through the pipeline as its own file, linked to the archive
+                members = email_agent.expand_archive(file_info)
+                member_ids = []
+                for index, member in enumerate(members, 1):
+                    member_id = f"{example_id}_{index}"
+                    st.session_state.examples_metadata[member_id] = dict(member, parent_id=example_id)
+                    member_ids.append(member_id)
+                st.session_state.process_queue[:0] = member_ids
                 
-                # Track processing stage for visualization
-                if 'file_processing_stages' in st.session_state:
-                    st.session_state.file_processing_stages[example_id] = "question"
-                
-                # Add log entry for questions asked
                 st.session_state.agent_logs.append({
                     "timestamp": datetime.now(),
-                    "agent": "Question Agent",
-                    "action": f"Generated {len(questions)} questions about the file",
-                    "status": "pending",
-                    "duration": random.uniform(0.5, 1.5),
+                    "agent": "Email Agent",
+                    "action": f"Expanded archive {example_data['filename']} into {len(members)} files",
+                    "status": "complete" if members else "error",
+                    "duration": random.uniform(0.05, 0.2),
                     "file_id": example_id
                 })
-            
-            # Transform the data
-            transformed_data = transformation_agent.transform_data(file_info, validation_result)
-            time.sleep(1.0)  # Simulate processing time
-            
-            # Track processing stage for visualization
-            if 'file_processing_stages' in st.session_state:
-                st.session_state.file_processing_stages[example_id] = "transform"
-            
-            # Upload the data
-            storage_result = upload_agent.store_data(transformed_data)
-            time.sleep(0.5)  # Simulate processing time
-            
-            # Track processing stage for visualization
-            if 'file_processing_stages' in st.session_state:
-                st.session_state.file_processing_stages[example_id] = "upload"
-            
-            # Update processed files list
-            st.session_state.processed_files.append({
-                "example_id": example_id,
-                "filename": example_data["filename"],
-                "file_type": example_data["file_type"],
-                "sender": example_data["sender"],
-                "subject": example_data["subject"],
-                "received_time": datetime.now(),
-                "processing_time": random.uniform(1.0, 5.0),
-                "status": "Processed" if not validation_result.get("needs_clarification", False) else "Awaiting Clarification",
-                "complexity": example_data["complexity"]
-            })
+                st.session_state.processed_files.append({
+                    "example_id": example_id,
+                    "filename": example_data["filename"],
+                    "file_type": example_data["file_type"],
+                    "sender": example_data["sender"],
+                    "subject": example_data["subject"],
+                    "received_time": datetime.now(),
+                    "processing_time": file_info["processing_time"],
+                    "status": f"Expanded into {len(members)} files" if members else "Unreadable Archive",
+                    "complexity": example_data["complexity"]
+                })
+                email_agent.record_result(file_info, example_id, {
+                    "status": st.session_state.processed_files[-1]["status"],
+                    "total_records": 0
+                })
+            else:
+                # Track processing stage for visualization
+                if 'file_processing_stages' in st.session_state:
+                    st.session_state.file_processing_stages[example_id] = "email"
+                
+                # Validation agent checks the file
+                validation_result = validation_agent.validate_file(file_info)
+                time.sleep(0.5)  # Simulate processing time
+                
+                # Keep the issues found in the actual file content for the validation view
+                if validation_result.get("data_checked"):
+                    st.session_state.validation_results[example_id] = validation_result["issues"]
+                
+                # Track processing stage for visualization
+                if 'file_processing_stages' in st.session_state:
+                    st.session_state.file_processing_stages[example_id] = "validation"
+                
+                # If validation requires questions, ask them
+                if validation_result.get("needs_clarification", False):
+                    questions = question_agent.generate_questions(validation_result)
+                
+                    # Issues answered before are resolved without asking again
+                    if validation_result["auto_resolved"]:
+                        st.session_state.agent_logs.append({
+                            "timestamp": datetime.now(),
+                            "agent": "Question Agent",
+                            "action": f"Resolved {len(validation_result['auto_resolved'])} issues with answers remembered from {example_data['sender']}",
+                            "status": "complete",
+                            "duration": random.uniform(0.05, 0.2),
+                            "file_id": example_id
+                        })
+                    if not questions:
+                        validation_result["needs_clarification"] = False
+                
+                if validation_result.get("needs_clarification", False):
+                    st.session_state.questions_asked.append({
+                        "example_id": example_id,
+                        "sender": example_data["sender"],
+                        "filename": example_data["filename"],
+                        "questions": questions,
+                        "answered": False,
+                        "digest_id": None,
+                        "timestamp": datetime.now()
+                    })
+                
+                    # Track processing stage for visualization
+                    if 'file_processing_stages' in st.session_state:
+                        st.session_state.file_processing_stages[example_id] = "question"
+                
+                    # Add log entry for questions asked
+                    st.session_state.agent_logs.append({
+                        "timestamp": datetime.now(),
+                        "agent": "Question Agent",
+                        "action": f"Generated {len(questions)} questions about the file",
+                        "status": "pending",
+                        "duration": random.uniform(0.5, 1.5),
+                        "file_id": example_id
+                    })
+                
+                # Park only the rows affected by open questions, the rest does not wait for the answers
+                parked_rows = []
+                if validation_result.get("needs_clarification", False):
+                    parked_rows = transformation_agent.split_parked_rows(validation_result, questions)
+                    st.session_state.parked_slices[example_id] = {
+                        "file_info": file_info,
+                        "validation_result": validation_result,
+                        "rows": parked_rows
+                    }
+                
+                if parked_rows is None:
+                    # The issues do not point at rows, so the whole file waits
+                    st.session_state.agent_logs.append({
+                        "timestamp": datetime.now(),
+                        "agent": "Transformation Agent",
+                        "action": "Parked the whole file until the clarification questions are answered",
+                        "status": "pending",
+                        "duration": random.uniform(0.05, 0.2),
+                        "file_id": example_id
+                    })
+                else:
+                    # Transform the data
+                    transformed_data = transformation_agent.transform_data(file_info, validation_result, parked_rows=parked_rows)
+                    time.sleep(1.0)  # Simulate processing time
+                
+                    # Track processing stage for visualization
+                    if 'file_processing_stages' in st.session_state:
+                        st.session_state.file_processing_stages[example_id] = "transform"
+                
+                    # Upload the data, a parked file keeps its parsed content for the rows uploaded after the answers
+                    frame = parked_frame(st.session_state.parked_slices[example_id]) if example_id in st.session_state.parked_slices else None
+                    storage_result = upload_agent.store_data(transformed_data, file_id=example_id, frame=frame)
+                    time.sleep(0.5)  # Simulate processing time
+                
+                    # Track processing stage for visualization
+                    if 'file_processing_stages' in st.session_state:
+                        st.session_state.file_processing_stages[example_id] = "upload"
+                
+                # Update processed files list
+                st.session_state.processed_files.append({
+                    "example_id": example_id,
+                    "filename": example_data["filename"],
+                    "file_type": example_data["file_type"],
+                    "sender": example_data["sender"],
+                    "subject": example_data["subject"],
+                    "received_time": datetime.now(),
+                    "processing_time": random.uniform(1.0, 5.0),
+                    "status": "Processed" if not validation_result.get("needs_clarification", False) else "Awaiting Clarification",
+                    "complexity": example_data["complexity"],
+                    "parent_id": example_data.get("parent_id")
+                })
+                
+                # Add final log entry
+                if parked_rows is not None:
+                    parked_note = f" ({len(parked_rows)} rows parked awaiting clarification)" if parked_rows else ""
+                    st.session_state.agent_logs.append({
+                        "timestamp": datetime.now(),
+                        "agent": "Upload Agent",
+                        "action": f"Data queued for upload to {len(storage_result['storage_results'])} systems in common format{parked_note}",
+                        "status": "complete",
+                        "duration": random.uniform(0.3, 1.0),
+                        "file_id": example_id
+                    })
+                
+                # Remember the outcome so exact duplicates of this file skip the pipeline
+                email_agent.record_result(file_info, example_id, {
+                    "status": st.session_state.processed_files[-1]["status"],
+                    "total_records": storage_result["total_records"] if parked_rows is not None else 0
+                })
             
             # Update processing status
             st.session_state.processing_status[example_id] = "complete"
             
-            # Add final log entry
-            st.session_state.agent_logs.append({
-                "timestamp": datetime.now(),
-                "agent": "Upload Agent",
-                "action": f"Data uploaded successfully in common format",
-                "status": "complete",
-                "duration": random.uniform(0.3, 1.0),
-                "file_id": example_id
-            })
+            # Send one clarification digest per sender once its queued files are done
+            open_senders = {
+                st.session_state.examples_metadata[queued_id]["sender"]
+                for queued_id in st.session_state.process_queue
+                if queued_id in st.session_state.examples_metadata
+            }
+            for digest in question_agent.build_digests(st.session_state.questions_asked, open_senders):
+                st.session_state.clarification_digests.append(digest)
+                st.session_state.agent_logs.append({
+                    "timestamp": datetime.now(),
+                    "agent": "Question Agent",
+                    "action": f"Sent clarification digest with {len(digest['questions'])} questions about {len(digest['example_ids'])} files to {digest['sender']}",
+                    "status": "complete",
+                    "duration": random.uniform(0.2, 0.6),
+                    "file_id": example_id
+                })
             
             # Check if there are more files in the queue to process
             if st.session_state.process_queue:
@@ -699,12 +699,27 @@ def render_file_details():
                         st.markdown(f"**Context:** {question['context']}")
                         
                         # Add simulated response if not answered
-                        if not file_questions.get("answered", False):
-                            st.text_input("Your response:", key=f"response_{file_id}_{i}", 
-                                         placeholder="Type your response here...")
+                        if "answer" in question:
+                            st.markdown(f"**Answer:** {question['answer']}")
+                        elif not file_questions.get("answered", False):
+                            if question.get("options"):
+                                labels = question.get("option_labels", {})
+                                response = st.selectbox("Your response:", question["options"], key=f"response_{file_id}_{i}",
+                                                        format_func=lambda option: labels.get(option, option))
+                            else:
+                                response = st.text_input("Your response:", key=f"response_{file_id}_{i}", 
+                                             placeholder="Type your response here...")
                             if st.button("Send Response", key=f"send_{file_id}_{i}"):
-                                st.success("Response sent! The agent will process your answer.")
-                                # In a real app, this would trigger further processing
+                                if response.strip():
+                                    # Picked up by the pipeline in app.py
+                                    st.session_state.setdefault("answer_queue", []).append({
+                                        "example_id": file_id,
+                                        "question_index": i,
+                                        "answer": response.strip()
+                                    })
+                                    st.success("Response sent! The agent will process your answer.")
+                                else:
+                                    st.warning("Please type a response before sending.")
     
     # Email Communication Tab
     with email_tab:
@@ -735,28 +750,34 @@ def render_file_details():
                     html_content += "</div>"
                     st.markdown(html_content, unsafe_allow_html=True)
                 
-                # Questions Email (if any)
+                # Questions Email (if any), sent as one digest per sender covering all its files
                 file_questions = next((q for q in st.session_state.questions_asked if q["example_id"] == file_id), None)
-                if file_questions:
-                    with st.expander("Outgoing Email - Clarification Questions", expanded=True):
+                digest = None
+                if file_questions and file_questions.get("digest_id"):
+                    digest = next((d for d in st.session_state.get("clarification_digests", [])
+                                   if d["digest_id"] == file_questions["digest_id"]), None)
+                if digest:
+                    with st.expander("Outgoing Email - Clarification Digest", expanded=True):
                         # Format questions
-                        questions_text = "\n".join([f"{i+1}. {q['question']}" for i, q in enumerate(file_questions["questions"])])
+                        questions_text = "\n".join([f"{i+1}. {q['question']} <em>({', '.join(q['files'])})</em>" for i, q in enumerate(digest["questions"])])
                         questions_html = questions_text.replace('\n', '<br/>')
                         sender_first_name = file['sender'].split()[0]
                         
                         html_content = "<div style='border: 1px solid #ddd; padding: 15px; border-radius: 5px;'>"
                         html_content += "<strong>From:</strong> Data Processing Team &lt;data.processing@ourcompany.com&gt;<br/>"
                         html_content += "<strong>To:</strong> " + file['sender'] + " &lt;" + sender_email + "@example.com&gt;<br/>"
-                        html_content += "<strong>Subject:</strong> Re: " + file['subject'] + " - Clarification Needed<br/>"
-                        html_content += "<strong>Date:</strong> " + (file['received_time'] + timedelta(minutes=5)).strftime('%a, %d %b %Y %H:%M:%S') + "<br/>"
+                        html_content += "<strong>Subject:</strong> Clarification Needed - " + str(len(digest['example_ids'])) + " file(s)<br/>"
+                        html_content += "<strong>Date:</strong> " + digest['timestamp'].strftime('%a, %d %b %Y %H:%M:%S') + "<br/>"
                         html_content += "<hr/>"
                         html_content += "<p>Hello " + sender_first_name + ",</p>"
-                        html_content += "<p>Thank you for sending the data file. Before we can complete processing, we need clarification on a few points:</p>"
+                        html_content += "<p>Thank you for sending your data files. Before we can complete processing, we need clarification on a few points:</p>"
                         html_content += "<p>" + questions_html + "</p>"
                         html_content += "<p>Your prompt response will help us process this data accurately and efficiently.</p>"
                         html_content += "<p>Best regards,<br/>Data Processing Team</p>"
                         html_content += "</div>"
                         st.markdown(html_content, unsafe_allow_html=True)
+                elif file_questions:
+                    st.info(f"Questions about this file are queued for the next clarification digest to {file['sender']}.")
                 
                 # Confirmation Email
                 if file['status'] == "Processed":
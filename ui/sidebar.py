@@ -2,9 +2,15 @@ import streamlit as st
 import pandas as pd
 import random
 import os
+import shutil
 from io import BytesIO
 from docx import Document
 from PyPDF2 import PdfReader
+from utils.file_utils import EXTENSION_FILE_TYPES, COMPRESSION_EXTENSIONS, hash_file_content, file_type_for
+from utils.blob_store import BlobStore, SPOOL_THRESHOLD
+from utils.watch_folder import get_watcher
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 def render_sidebar():
     """
@@ -16,6 +22,11 @@ def render_sidebar():
     if "examples_metadata" not in st.session_state or not st.session_state.examples_metadata:
         st.session_state.examples_metadata = get_example_metadata()
     
+    # Queue files that landed in the drop folder since the last run
+    if st.session_state.get("watch_drop_folder"):
+        st.session_state.drop_folder_listener = watch_drop_folder(get_watcher())
+        queue_dropped_files(get_watcher())
+    
     # Group examples by different criteria
     examples = st.session_state.examples_metadata
     
@@ -44,6 +55,10 @@ def render_sidebar():
         for key in ["processed_files", "agent_logs", "questions_asked", "processing_status"]:
             st.session_state[key] = []
         st.session_state.processing_status = {}
+        st.session_state.validation_results = {}
+        st.session_state.clarification_digests = []
+        st.session_state.parked_slices = {}
+        st.session_state.answer_queue = []
         st.session_state.selected_example = None
         st.session_state.process_queue = []
         st.sidebar.success("Demo reset successfully!")
@@ -178,18 +193,40 @@ def render_sidebar():
         ss.setdefault("uploaded_registry", {})
         ss.setdefault("upload_success_shown", False)
 
-        ext_to_bucket = {"csv": "csv", "xlsx": "excel", "json": "json", "docx": "word", "pdf": "pdf"}
-        supported_types_list = ["csv", "xlsx", "json", "docx", "pdf"]
+        supported_types_list = list(EXTENSION_FILE_TYPES) + list(COMPRESSION_EXTENSIONS)
         
         if st.button(
             "Upload All Test Files",
-            disabled=True, 
-            help="The functionality will be available in upcoming releases."
+            help="Copies the test files into the watched drop folder."
         ):
             script_dir = os.path.dirname(os.path.abspath(__file__))  # /.../project_root/ui
             test_folder = os.path.join(script_dir, "..", "test_files")  # ../test-files
             test_folder = os.path.abspath(test_folder) 
             test_files = [f for f in os.listdir(test_folder) if os.path.isfile(os.path.join(test_folder, f))]
+            
+            ss.watch_drop_folder = True
+            watcher = get_watcher()
+            # This run already passed the point where a watching session registers its listener
+            ss.drop_folder_listener = watch_drop_folder(watcher)
+            for test_file in test_files:
+                # Write under a partial name and rename, like an SFTP client, so the file is only seen complete
+                partial_path = os.path.join(watcher.directory, f"{test_file}.part")
+                shutil.copyfile(os.path.join(test_folder, test_file), partial_path)
+                os.replace(partial_path, os.path.join(watcher.directory, test_file))
+            st.toast(f"{len(test_files)} test file(s) copied to the drop folder")
+
+        watching = st.toggle(
+            "Watch drop folder",
+            value=ss.get("watch_drop_folder", False),
+            help="Files landing in the drop folder are queued for processing as soon as they are completely written."
+        )
+        if watching != ss.get("watch_drop_folder", False):
+            ss.watch_drop_folder = watching
+            st.rerun()
+        if watching:
+            st.caption(f"Watching {get_watcher().directory}")
+            if not ss.get("drop_folder_listener", True):
+                st.caption("New files are queued on the next interaction with the app")
 
 
         uploaded_files = st.file_uploader(
@@ -209,11 +246,10 @@ def render_sidebar():
             for uploaded_file in uploaded_files:
                 file_name = uploaded_file.name
                 ext = file_name.split(".")[-1].lower()
-                bucket = ext_to_bucket.get(ext, ext)
+                bucket = file_type_for(file_name) or ext
 
-                file_size = getattr(uploaded_file, "size", None)
-                file_type_mime = getattr(uploaded_file, "type", "")
-                file_key = f"{file_name}|{file_size}|{file_type_mime}"
+                # Each upload keeps its ID across reruns, identical content is caught by the Email Agent
+                file_key = uploaded_file.file_id
 
                 if file_key in ss.uploaded_registry:
                     example_id = ss.uploaded_registry[file_key]
@@ -229,9 +265,19 @@ def render_sidebar():
                         "sender_email": "user@local",
                         "subject": f"Uploaded file: {file_name}",
                         "complexity": "unknown",
-                        "email_body": "This file was uploaded by the user.",
-                        "file_obj": uploaded_file
+                        "email_body": "This file was uploaded by the user."
                     }
+                    
+                    # Large uploads are spooled to disk and passed on as a handle instead of pinned in the session
+                    if uploaded_file.size > SPOOL_THRESHOLD:
+                        uploaded_file.seek(0)
+                        blob = BlobStore().put_stream(uploaded_file)
+                        ss.examples_metadata[example_id]["blob"] = blob
+                        ss.examples_metadata[example_id]["content_hash"] = blob["content_hash"]
+                    else:
+                        ss.examples_metadata[example_id]["file_obj"] = uploaded_file
+                        ss.examples_metadata[example_id]["content_hash"] = hash_file_content({"file_obj": uploaded_file})
+                    uploaded_file.seek(0)
 
                 uploaded_ids.append(example_id)
                 
@@ -327,6 +373,106 @@ def render_sidebar():
         Contact us for a detailed cost estimate based on your specific requirements.
         """)
 
+def queue_dropped_files(watcher):
+    """
+    Registers the files that landed in the drop folder and adds them to the process queue.
+    
+    The content of each file is moved into the blob store, like a mail
+    attachment, and the file itself to the processed/ folder, so a restart
+    does not pick it up again. Unsupported files go to the failed/ folder.
+    
+    Args:
+        watcher (DropFolderWatcher): Watcher of the drop folder
+    """
+    ss = st.session_state
+    ss.setdefault("drop_counter", 0)
+    ss.setdefault("process_queue", [])
+    
+    for batch in watcher.drain():
+        for path in batch:
+            file_name = os.path.basename(path)
+            file_type = file_type_for(file_name)
+            if file_type is None:
+                watcher.settle(path, failed=True)
+                continue
+            try:
+                with open(path, "rb") as f:
+                    blob = BlobStore().put_stream(f)
+            except FileNotFoundError:
+                continue  # Removed again before it was taken
+            watcher.settle(path)
+            
+            ss.drop_counter += 1
+            example_id = f"drop_{ss.drop_counter}"
+            ss.examples_metadata[example_id] = {
+                "filename": file_name,
+                "file_type": file_type,
+                "sender": "Drop Folder",
+                "sender_email": "drop@local",
+                "subject": f"Dropped file: {file_name}",
+                "complexity": "unknown",
+                "email_body": "This file was picked up from the drop folder.",
+                "file_path": blob["path"],
+                "blob": blob,
+                "content_hash": blob["content_hash"]
+            }
+            ss.process_queue.append(example_id)
+    
+    if ss.process_queue and not ss.get("selected_example"):
+        ss.selected_example = ss.process_queue.pop(0)
+
+def _active_session(session_id):
+    """
+    Finds a browser session from outside of its script run, e.g. from the watcher's thread.
+    
+    Streamlit has no public API for this, so this is the one place that
+    reaches into the runtime's session manager. If a Streamlit version does
+    not have it, no session is found and the files are only picked up on
+    the session's next run.
+    
+    Returns:
+        AppSession or None: The session, or None if it is closed or cannot be reached
+    """
+    try:
+        session_info = Runtime.instance()._session_mgr.get_active_session_info(session_id)
+    except (AttributeError, RuntimeError):
+        return None
+    return session_info.session if session_info is not None else None
+
+def watch_drop_folder(watcher):
+    """
+    Reruns this browser session as soon as the watcher has new files, without the browser polling.
+    
+    The rerun is requested from the watcher's thread, the way Streamlit
+    reruns an app whose source changed. A session that is processing a file
+    is not interrupted, it takes the new files in the rerun that ends its
+    processing. The listener removes itself once the session is closed or
+    stops watching.
+    
+    Args:
+        watcher (DropFolderWatcher): Watcher of the drop folder
+        
+    Returns:
+        bool: Whether the listener was registered, False if this session cannot be rerun from another thread
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None or _active_session(ctx.session_id) is None:
+        return False
+    session_id = ctx.session_id
+    
+    def rerun():
+        session = _active_session(session_id)
+        if session is None:
+            return False
+        session_state = session.session_state
+        if "watch_drop_folder" not in session_state or not session_state["watch_drop_folder"]:
+            return False
+        if "selected_example" not in session_state or not session_state["selected_example"]:
+            session.request_rerun(None)
+    
+    watcher.add_listener(session_id, rerun)
+    return True
+
 def get_example_metadata():
     """
     Generate metadata for example files.
@@ -25,10 +25,23 @@ def render_validation_tab(selected_file):
             file_type = example_data["file_type"]
             complexity = example_data["complexity"]
             
-            # Create simulated validation results based on file type and complexity
+            # Use the issues found in the file content when it was checked,
+            # otherwise create simulated validation results based on file type and complexity
             validation_issues = []
+            checked_issues = st.session_state.get("validation_results", {}).get(file_id)
             
-            if complexity == "high":
+            if checked_issues is not None:
+                for issue in checked_issues:
+                    # Column-level issues get one row per affected column
+                    column_counts = issue.get("columns") or {"(file)": issue.get("count", 1)}
+                    for column, count in column_counts.items():
+                        validation_issues.append({
+                            "severity": issue["severity"],
+                            "field": column,
+                            "issue": issue["type"],
+                            "count": count
+                        })
+            elif complexity == "high":
                 validation_issues = [
                     {"severity": "high", "field": "customer_id", "issue": "Missing values in required field", "count": random.randint(5, 15)},
                     {"severity": "medium", "field": "transaction_date", "issue": "Invalid date format", "count": random.randint(3, 10)},
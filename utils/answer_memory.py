@@ -0,0 +1,65 @@
+import os
+import time
+import sqlite3
+import threading
+from utils.file_utils import get_data_dir
+
+class AnswerMemory:
+    """
+    Persistent store of the answers senders gave to clarification questions.
+
+    Answers are indexed by (sender, issue type, column), so a repeat of an
+    issue that was already answered is resolved with a single primary key
+    lookup instead of another question and another wait for a reply.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_data_dir("answers"), "answers.sqlite3")
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "sender TEXT NOT NULL, issue_type TEXT NOT NULL, column_name TEXT NOT NULL, "
+                "answer TEXT NOT NULL, updated_at REAL NOT NULL, times_applied INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (sender, issue_type, column_name))"
+            )
+
+    def remember(self, sender, issue_type, column, answer):
+        """
+        Stores or replaces the answer for an issue.
+
+        Args:
+            sender (str): Sender who answered
+            issue_type (str): Type of the validation issue
+            column (str): Column the issue was about, empty for file-level issues
+            answer (str): The answer given
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO answers (sender, issue_type, column_name, answer, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (sender, issue_type, column_name) DO UPDATE SET answer = excluded.answer, "
+                "updated_at = excluded.updated_at",
+                (sender, issue_type, column or "", answer, time.time())
+            )
+
+    def lookup(self, sender, issue_type, column):
+        """
+        Finds the stored answer for an issue and counts it as applied.
+
+        Returns:
+            str or None: The stored answer, or None if the issue was never answered
+        """
+        key = (sender, issue_type, column or "")
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT answer FROM answers WHERE sender = ? AND issue_type = ? AND column_name = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE answers SET times_applied = times_applied + 1 "
+                    "WHERE sender = ? AND issue_type = ? AND column_name = ?", key
+                )
+            return row[0]
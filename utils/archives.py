@@ -0,0 +1,32 @@
+import os
+import zipfile
+from utils.file_utils import file_type_for
+
+MAX_ARCHIVE_MEMBERS = 1000  # Members beyond this are not expanded
+
+def list_archive_members(path, max_members=MAX_ARCHIVE_MEMBERS):
+    """
+    Lists the members of a zip archive that the pipeline can process, from the central directory only.
+
+    Directories, hidden files, macOS resource forks, nested archives and
+    unsupported file types are skipped.
+
+    Args:
+        path (str): Zip archive on disk
+        max_members (int): Maximum number of members returned
+
+    Returns:
+        list: zipfile.ZipInfo of each processable member, in archive order
+    """
+    members = []
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                continue
+            if file_type_for(name) in (None, "archive"):
+                continue
+            members.append(info)
+            if len(members) == max_members:
+                break
+    return members
@@ -0,0 +1,66 @@
+import os
+import uuid
+import hashlib
+from utils.file_utils import get_data_dir
+
+SPOOL_THRESHOLD = 1024 * 1024  # Uploads above this size are spooled to disk instead of kept in memory
+
+class BlobStore:
+    """
+    Content-addressed store of file content on local disk.
+
+    Each blob is stored once under the SHA-256 of its content, so the same
+    attachment received twice takes the space of one. Blobs are handed
+    through the pipeline as small handles in file_info["blob"], which
+    utils.file_utils.open_file_source maps into memory.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or get_data_dir("blobs")
+
+    def path_for(self, content_hash):
+        return os.path.join(self.directory, content_hash[:2], content_hash)
+
+    def _handle(self, content_hash, path):
+        return {"content_hash": content_hash, "path": path, "size": os.path.getsize(path)}
+
+    def _move_into_place(self, tmp_path, content_hash):
+        path = self.path_for(content_hash)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return self._handle(content_hash, path)
+
+    def put_stream(self, source, chunk_size=1024 * 1024):
+        """
+        Copies a binary stream into the store, hashing it on the way.
+
+        Args:
+            source (file-like object): Stream to copy from its current position
+            chunk_size (int): Number of bytes copied at a time
+
+        Returns:
+            dict: Handle of the blob (content_hash, path, size)
+        """
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(self.directory, f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as out:
+            for chunk in iter(lambda: source.read(chunk_size), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        return self._move_into_place(tmp_path, digest.hexdigest())
+
+    def adopt(self, path, content_hash):
+        """
+        Moves a file that is already on disk and hashed, such as a spooled attachment, into the store.
+
+        Args:
+            path (str): File to move, it is removed if the store already has its content
+            content_hash (str): SHA-256 of the file content
+
+        Returns:
+            dict: Handle of the blob (content_hash, path, size)
+        """
+        return self._move_into_place(path, content_hash)
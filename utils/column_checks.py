@@ -0,0 +1,114 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from utils.shared import get_shared
+
+MIN_PARALLEL_COLUMNS = 8  # Files with fewer numeric columns are checked inline, the pool costs more than it saves
+
+def missing_masks(df, columns):
+    """
+    Finds the missing values of several columns in one pass over the frame.
+
+    Args:
+        df (pd.DataFrame): Data to check
+        columns (list): Names of the columns to check
+
+    Returns:
+        dict: Column name -> boolean mask of its missing values
+    """
+    if not columns:
+        return {}
+    missing = df[columns].isna().to_numpy()
+    return {name: missing[:, i] for i, name in enumerate(columns)}
+
+def non_numeric_mask(series, min_numeric_share=0.8):
+    """
+    Finds the stray non-numeric values of a text column that is mostly numeric.
+
+    Args:
+        series (pd.Series): Column to inspect
+        min_numeric_share (float): Share of parseable values from which the column is considered numeric
+
+    Returns:
+        np.ndarray or None: Boolean mask of the values that do not parse as numbers, or None if the
+            column is not a numeric column
+    """
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return None
+    present = series.notna().to_numpy()
+    if not present.any():
+        return None
+    parsed = pd.to_numeric(series, errors="coerce").notna().to_numpy()
+    if parsed.sum() < present.sum() * min_numeric_share:
+        return None
+    return present & ~parsed
+
+def replacement_mask(df):
+    """Boolean mask of the rows holding a U+FFFD replacement character, left where bytes could not be decoded"""
+    mask = np.zeros(len(df), dtype=bool)
+    for name in df.columns:
+        series = df[name]
+        if series.dtype == object or pd.api.types.is_string_dtype(series):
+            mask |= series.astype("string").str.contains("\ufffd", regex=False).fillna(False).to_numpy(dtype=bool)
+    return mask
+
+def as_float_array(series):
+    """Column values as a float array with NaN for missing values, or None for non-numeric columns"""
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return None
+    return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+def _column_check_pool():
+    return get_shared("column_check_pool", None, lambda: ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="column-checks"))
+
+def _merge_results(results):
+    merged = {}
+    for name, column_results in results:
+        for issue_type, mask in column_results:
+            if mask is not None and mask.any():
+                merged.setdefault(issue_type, {})[str(name)] = np.flatnonzero(mask).tolist()
+    return merged
+
+def run_column_checks(df, check_column):
+    """
+    Runs independent per-column checks and merges their results by issue type.
+
+    Columns are checked one after the other, since pandas operations on
+    object columns hold the GIL. Checks that cover many columns at once are
+    cheaper over the whole frame, see missing_masks, and checks on numeric
+    values can run on arrays, see run_value_checks.
+
+    Args:
+        df (pd.DataFrame): Data to check
+        check_column (callable): Called as check_column(name, series), returns a list of
+            (issue type, np.ndarray boolean mask) pairs for that column
+
+    Returns:
+        dict: Issue type -> {column name: row positions}, merged over all columns
+    """
+    return _merge_results([(name, check_column(name, df[name])) for name in df.columns])
+
+def run_value_checks(columns, check_values):
+    """
+    Runs independent checks on numeric columns and merges their results by issue type.
+
+    The checks get the values as float arrays, e.g. from as_float_array, so
+    they are NumPy kernels that release the GIL and files with many numeric
+    columns are checked across a thread pool.
+
+    Args:
+        columns (dict): Column name -> np.ndarray of float values
+        check_values (callable): Called as check_values(name, values), returns a list of
+            (issue type, np.ndarray boolean mask) pairs for that column. May run on several threads.
+
+    Returns:
+        dict: Issue type -> {column name: row positions}, merged over all columns
+    """
+    def check(item):
+        name, values = item
+        return name, check_values(name, values)
+
+    if len(columns) < MIN_PARALLEL_COLUMNS:
+        return _merge_results([check(item) for item in columns.items()])
+    return _merge_results(_column_check_pool().map(check, columns.items()))
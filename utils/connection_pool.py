@@ -0,0 +1,161 @@
+import time
+import threading
+from contextlib import contextmanager
+from utils.shared import get_shared
+
+class PooledConnection:
+    """A connection held by a pool, with the bookkeeping the pool needs"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+
+class ConnectionPool:
+    """
+    Thread-safe pool of connections to one target system.
+
+    min_size connections are opened up front and kept open, at most
+    max_size exist at once, and callers wait for a free one beyond that.
+    A connection that sat idle longer than health_check_interval is
+    checked before it is handed out, and replaced if the check fails.
+    Idle connections above min_size are closed after max_idle_time.
+
+    Args:
+        connect (callable): Opens a new raw connection
+        health_check (callable): Called with a raw connection, returns False or raises if it is unusable
+        close (callable): Closes a raw connection, defaults to its close() method
+    """
+
+    def __init__(self, connect, min_size=1, max_size=4, health_check=None, close=None,
+                 health_check_interval=30.0, max_idle_time=300.0, acquire_timeout=30.0):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.health_check = health_check
+        self.close_raw = close or (lambda raw: raw.close())
+        self.health_check_interval = health_check_interval
+        self.max_idle_time = max_idle_time
+        self.acquire_timeout = acquire_timeout
+        self.idle = []
+        self.size = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "waits": 0}
+        for _ in range(min_size):
+            self.idle.append(self._open())
+
+    def _open(self):
+        connection = PooledConnection(self.connect())
+        self.size += 1
+        self.stats["created"] += 1
+        return connection
+
+    def _discard(self, connection):
+        self.size -= 1
+        self.stats["discarded"] += 1
+        try:
+            self.close_raw(connection.raw)
+        except Exception:
+            pass
+
+    def _is_healthy(self, connection, now):
+        if self.health_check is None or now - connection.last_used < self.health_check_interval:
+            return True
+        try:
+            return self.health_check(connection.raw) is not False
+        except Exception:
+            return False
+
+    def _evict_idle(self, now):
+        """Close idle connections above min_size that were not used for max_idle_time"""
+        keep = []
+        for connection in self.idle:
+            if self.size > self.min_size and now - connection.last_used > self.max_idle_time:
+                self._discard(connection)
+            else:
+                keep.append(connection)
+        self.idle = keep
+
+    def acquire(self):
+        """
+        Takes a connection out of the pool, opening one if none is idle and the pool is not full.
+
+        Returns:
+            PooledConnection: The connection, uses is 0 if it was just opened
+
+        Raises:
+            TimeoutError: If no connection became free within acquire_timeout
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._evict_idle(now)
+                while self.idle:
+                    connection = self.idle.pop()
+                    if self._is_healthy(connection, now):
+                        self.stats["reused"] += 1
+                        return connection
+                    self._discard(connection)
+                if self.size < self.max_size:
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise TimeoutError(f"No connection free after {self.acquire_timeout}s")
+                self.stats["waits"] += 1
+                self.condition.wait(timeout=remaining)
+            # Reserve the slot, the connection is opened outside the lock
+            self.size += 1
+        try:
+            raw = self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.stats["created"] += 1
+        return PooledConnection(raw)
+
+    def release(self, connection, broken=False):
+        """Returns a connection to the pool, or closes it if the caller found it broken"""
+        with self.condition:
+            if broken or self.closed:
+                self._discard(connection)
+            else:
+                connection.uses += 1
+                connection.last_used = time.monotonic()
+                self.idle.append(connection)
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager around acquire and release, a connection that raised is not reused"""
+        connection = self.acquire()
+        try:
+            yield connection
+        except Exception:
+            self.release(connection, broken=True)
+            raise
+        self.release(connection)
+
+    def close(self):
+        """Closes the idle connections, connections in use are closed when released"""
+        with self.condition:
+            self.closed = True
+            for connection in self.idle:
+                self._discard(connection)
+            self.idle = []
+
+def get_pool(name, connect, **options):
+    """
+    Returns the process-wide pool with this name, creating it on first use.
+
+    Args:
+        name (str): Name of the target system
+        connect (callable): Opens a new raw connection
+        **options: Further ConnectionPool arguments, only used when the pool is created
+    """
+    return get_shared("pool", name, lambda: ConnectionPool(connect, **options))
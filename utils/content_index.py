@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from utils.file_utils import get_data_dir
+
+class ContentIndex:
+    """
+    Persistent index of the attachments already ingested, keyed by the SHA-256 of their content.
+
+    An attachment whose content was seen before, under any name, is an exact
+    duplicate and is answered with the stored result of its first ingest.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_data_dir("content_index"), "content.sqlite3")
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS attachments ("
+                "content_hash TEXT PRIMARY KEY, file_id TEXT NOT NULL, filename TEXT NOT NULL, "
+                "sender TEXT NOT NULL, result TEXT NOT NULL, first_seen REAL NOT NULL, "
+                "times_seen INTEGER NOT NULL DEFAULT 1)"
+            )
+
+    def lookup(self, content_hash):
+        """
+        Finds the first ingest of an attachment and counts this sighting.
+
+        Args:
+            content_hash (str): SHA-256 of the attachment content
+
+        Returns:
+            dict or None: file_id, filename, sender and result of the first ingest, or None if the content is new
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT file_id, filename, sender, result FROM attachments WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            if row is None:
+                return None
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE attachments SET times_seen = times_seen + 1 WHERE content_hash = ?", (content_hash,)
+                )
+            return {"file_id": row[0], "filename": row[1], "sender": row[2], "result": json.loads(row[3])}
+
+    def record(self, content_hash, file_id, filename, sender, result):
+        """
+        Stores the result of an attachment's ingest, replacing an earlier result of the same file.
+
+        Args:
+            content_hash (str): SHA-256 of the attachment content
+            file_id (str): ID of the file in the pipeline
+            filename (str): Name the attachment arrived under
+            sender (str): Sender of the attachment
+            result (dict): JSON-serializable outcome of the pipeline
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO attachments (content_hash, file_id, filename, sender, result, first_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (content_hash) DO UPDATE SET result = excluded.result "
+                "WHERE attachments.file_id = excluded.file_id",
+                (content_hash, file_id, filename, sender, json.dumps(result), time.time())
+            )
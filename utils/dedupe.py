@@ -0,0 +1,296 @@
+import os
+import math
+import time
+import atexit
+import threading
+import numpy as np
+import pandas as pd
+from utils.file_utils import get_data_dir, safe_key
+from utils.shared import get_shared
+
+def normalize_rows(df):
+    """
+    Normalizes a DataFrame so that rows differing only in whitespace or letter case compare equal.
+
+    Args:
+        df (pd.DataFrame): Data to normalize
+
+    Returns:
+        pd.DataFrame: Normalized copy of the data
+    """
+    normalized = df.copy()
+    for col in normalized.columns:
+        if normalized[col].dtype == object or pd.api.types.is_string_dtype(normalized[col]):
+            normalized[col] = normalized[col].astype("string").str.strip().str.lower()
+    return normalized
+
+def hash_rows(df):
+    """
+    Computes a 64-bit hash for every normalized row of a DataFrame in a single vectorized pass.
+
+    Args:
+        df (pd.DataFrame): Data to hash
+
+    Returns:
+        np.ndarray: Array of uint64 row hashes
+    """
+    if df.empty:
+        return np.empty(0, dtype=np.uint64)
+    return pd.util.hash_pandas_object(normalize_rows(df), index=False).to_numpy(dtype=np.uint64)
+
+def find_duplicate_rows(row_hashes):
+    """
+    Finds rows that repeat an earlier row of the same file.
+
+    Args:
+        row_hashes (np.ndarray): Row hashes from hash_rows
+
+    Returns:
+        np.ndarray: Boolean mask, True for every repeat after the first occurrence
+    """
+    return pd.Series(row_hashes).duplicated().to_numpy()
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over 64-bit row hashes.
+
+    Memory is bounded by the capacity and error rate chosen at creation time,
+    lookups cost a fixed number of bit probes per row and never miss a row
+    that was added, but may report a small fraction of false positives.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, hashes):
+        """Derive the bit positions of each hash using double hashing"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.num_bits)
+
+    def add(self, hashes):
+        """Add an array of row hashes to the filter"""
+        positions = self._positions(hashes).ravel()
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), masks)
+        self.count += len(hashes)
+
+    def contains(self, hashes):
+        """
+        Check which row hashes were probably added before.
+
+        Args:
+            hashes (np.ndarray): Row hashes to look up
+
+        Returns:
+            np.ndarray: Boolean mask, True where the row was probably seen before
+        """
+        if len(hashes) == 0:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(hashes)
+        bits = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+    def save(self, path):
+        """Persist the filter to disk, replacing any previous version atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                bits=self.bits,
+                meta=np.array([self.capacity, self.num_bits, self.num_hashes, self.count], dtype=np.int64),
+                error_rate=np.array([self.error_rate])
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a filter previously written with save"""
+        with np.load(path) as data:
+            capacity, num_bits, num_hashes, count = (int(v) for v in data["meta"])
+            bloom = cls.__new__(cls)
+            bloom.capacity = capacity
+            bloom.error_rate = float(data["error_rate"][0])
+            bloom.num_bits = num_bits
+            bloom.num_hashes = num_hashes
+            bloom.bits = data["bits"].copy()
+            bloom.count = count
+        return bloom
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that grows by adding slices, so it never fills up.
+
+    Each slice is a fixed BloomFilter. When the newest slice reaches its
+    capacity a new one is added with growth times the capacity and a
+    tightening times lower error rate. The error rates of the slices form a
+    geometric series, so the false positive rate of the whole filter stays
+    below error_rate however many rows are added, at the cost of one more
+    slice to probe per doubling.
+    """
+
+    def __init__(self, initial_capacity=1_000_000, error_rate=0.001, growth=2, tightening=0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.slices = []
+
+    @property
+    def count(self):
+        return sum(bloom.count for bloom in self.slices)
+
+    def _add_slice(self):
+        n = len(self.slices)
+        capacity = int(self.initial_capacity * self.growth ** n)
+        # Compound rate: error_rate * (1 - tightening) * (1 + tightening + tightening^2 + ...) = error_rate
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** n
+        self.slices.append(BloomFilter(capacity, error_rate))
+
+    def add(self, hashes):
+        """Add an array of row hashes, opening new slices as the current one fills up"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        while len(hashes):
+            if not self.slices or self.slices[-1].count >= self.slices[-1].capacity:
+                self._add_slice()
+            current = self.slices[-1]
+            room = current.capacity - current.count
+            current.add(hashes[:room])
+            hashes = hashes[room:]
+
+    def contains(self, hashes):
+        """
+        Check which row hashes were probably added before.
+
+        Args:
+            hashes (np.ndarray): Row hashes to look up
+
+        Returns:
+            np.ndarray: Boolean mask, True where the row was probably seen before
+        """
+        seen = np.zeros(len(hashes), dtype=bool)
+        for bloom in self.slices:
+            if seen.all():
+                break
+            seen |= bloom.contains(hashes)
+        return seen
+
+    def save(self, path):
+        """Persist the filter to disk, replacing any previous version atomically"""
+        arrays = {
+            "scalable": np.array([self.initial_capacity, len(self.slices)], dtype=np.int64),
+            "scalable_rates": np.array([self.error_rate, self.growth, self.tightening])
+        }
+        for n, bloom in enumerate(self.slices):
+            arrays[f"bits_{n}"] = bloom.bits
+            arrays[f"meta_{n}"] = np.array([bloom.capacity, bloom.num_bits, bloom.num_hashes, bloom.count], dtype=np.int64)
+            arrays[f"error_rate_{n}"] = np.array([bloom.error_rate])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a filter previously written with save, or a single fixed filter written by BloomFilter.save"""
+        with np.load(path) as data:
+            if "scalable" not in data:
+                legacy = BloomFilter.load(path)
+                scalable = cls(legacy.capacity, legacy.error_rate)
+                scalable.slices.append(legacy)
+                return scalable
+            initial_capacity, num_slices = (int(v) for v in data["scalable"])
+            error_rate, growth, tightening = (float(v) for v in data["scalable_rates"])
+            scalable = cls(initial_capacity, error_rate, growth, tightening)
+            for n in range(num_slices):
+                capacity, num_bits, num_hashes, count = (int(v) for v in data[f"meta_{n}"])
+                bloom = BloomFilter.__new__(BloomFilter)
+                bloom.capacity = capacity
+                bloom.error_rate = float(data[f"error_rate_{n}"][0])
+                bloom.num_bits = num_bits
+                bloom.num_hashes = num_hashes
+                bloom.bits = data[f"bits_{n}"].copy()
+                bloom.count = count
+                scalable.slices.append(bloom)
+        return scalable
+
+class SubmissionHistory:
+    """
+    Persistent per-sender Bloom filters of the rows received in previous submissions.
+
+    Filters are written to disk at most once per save_interval seconds and
+    on flush, rather than on every submission, since a filter grows to
+    megabytes. Rows recorded since the last save are lost if the process
+    dies, which only means they are not flagged if they are sent again.
+    """
+
+    def __init__(self, directory=None, capacity=1_000_000, error_rate=0.001, save_interval=5.0):
+        self.directory = directory or get_data_dir("row_history")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.save_interval = save_interval
+        self.filters = {}
+        self.dirty = set()
+        self.last_save = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _path(self, sender):
+        return os.path.join(self.directory, f"{safe_key(sender)}.npz")
+
+    def get_filter(self, sender):
+        """Returns the Bloom filter for a sender, loading it from disk on first use"""
+        if sender not in self.filters:
+            path = self._path(sender)
+            if os.path.exists(path):
+                self.filters[sender] = ScalableBloomFilter.load(path)
+            else:
+                self.filters[sender] = ScalableBloomFilter(self.capacity, self.error_rate)
+        return self.filters[sender]
+
+    def check_and_add(self, sender, row_hashes):
+        """
+        Flags rows already sent in an earlier submission, then records this submission.
+
+        Args:
+            sender (str): Sender the rows came from
+            row_hashes (np.ndarray): Row hashes of the new submission
+
+        Returns:
+            np.ndarray: Boolean mask, True where the row was probably sent before
+        """
+        with self.lock:
+            bloom = self.get_filter(sender)
+            seen_before = bloom.contains(row_hashes)
+            bloom.add(row_hashes)
+            self.dirty.add(sender)
+            if time.monotonic() - self.last_save >= self.save_interval:
+                self._save_dirty()
+        return seen_before
+
+    def flush(self):
+        """Writes the filters changed since the last save"""
+        with self.lock:
+            self._save_dirty()
+
+    def _save_dirty(self):
+        for sender in self.dirty:
+            self.filters[sender].save(self._path(sender))
+        self.dirty.clear()
+        self.last_save = time.monotonic()
+
+def get_submission_history(directory=None):
+    """Returns the process-wide submission history of a directory, whose pending changes are saved when the process exits"""
+    directory = os.path.abspath(directory or get_data_dir("row_history"))
+
+    def create():
+        history = SubmissionHistory(directory)
+        atexit.register(history.flush)
+        return history
+    return get_shared("submission_history", directory, create)
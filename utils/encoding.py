@@ -0,0 +1,129 @@
+import codecs
+import threading
+from utils.file_utils import open_decompressed_source
+
+SNIFF_BYTES = 64 * 1024  # Only this prefix of the file is inspected
+MAX_REPORTED_POSITIONS = 20
+
+# File types read as text, binary containers such as xlsx (a zip) or pdf have no text encoding
+TEXT_FILE_TYPES = ("csv", "json", "txt")
+
+# Encodings a sender can pick from when asked how a file was written, codec -> label
+ENCODING_CHOICES = {
+    "utf-8": "UTF-8",
+    "cp1252": "Windows-1252 (Western European)",
+    "latin-1": "ISO-8859-1 (Latin-1)",
+    "utf-16": "UTF-16"
+}
+
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Bytes that have no character assigned in cp1252
+CP1252_UNDEFINED = frozenset(b"\x81\x8d\x8f\x90\x9d")
+
+class _EnoughPositions(Exception):
+    pass
+
+_scan = threading.local()
+
+def _record_invalid_utf8(error):
+    """Error handler noting where an invalid sequence starts and skipping it"""
+    _scan.positions.append(error.start)
+    if len(_scan.positions) >= MAX_REPORTED_POSITIONS:
+        raise _EnoughPositions()
+    return "", error.end
+
+codecs.register_error("sniff-invalid-utf8", _record_invalid_utf8)
+
+def _invalid_utf8_positions(data):
+    """Byte offsets where the data stops being valid UTF-8, ignoring a sequence cut off at the end"""
+    # One decoding pass, the error handler collects the offsets instead of restarting after each one
+    _scan.positions = []
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="sniff-invalid-utf8")
+    try:
+        decoder.decode(data, final=False)
+    except _EnoughPositions:
+        pass
+    positions, _scan.positions = _scan.positions, None
+    return positions
+
+def _looks_like_utf16(data):
+    """Detect BOM-less UTF-16 from the NUL bytes of mostly-ASCII text"""
+    sample = data[:1024]
+    if len(sample) < 4:
+        return None
+    even_nuls = sample[0::2].count(0)
+    odd_nuls = sample[1::2].count(0)
+    half = len(sample) // 2
+    if odd_nuls > half * 0.3 and even_nuls < half * 0.05:
+        return "utf-16-le"
+    if even_nuls > half * 0.3 and odd_nuls < half * 0.05:
+        return "utf-16-be"
+    return None
+
+def sniff_encoding(data):
+    """
+    Detects the text encoding of a file from a prefix of its bytes.
+
+    Byte order marks are checked first, then the prefix is validated as
+    BOM-less UTF-16, UTF-8 and cp1252 in that order. Only the prefix is
+    inspected, so the check costs microseconds regardless of file size.
+
+    Args:
+        data (bytes): First bytes of the file
+
+    Returns:
+        dict: Detected codec, whether a BOM was found, and the offsets of bytes
+            that are not valid UTF-8
+    """
+    for bom, codec in BOMS:
+        if data.startswith(bom):
+            return {"codec": codec, "bom": True, "invalid_positions": [], "bytes_inspected": len(data)}
+
+    # NUL-heavy UTF-16 text is still valid UTF-8, so it has to be ruled out first
+    invalid_positions = []
+    codec = _looks_like_utf16(data)
+    if codec is None:
+        invalid_positions = _invalid_utf8_positions(data)
+        if not invalid_positions:
+            codec = "utf-8"
+        elif CP1252_UNDEFINED.isdisjoint(data):
+            codec = "cp1252"
+        else:
+            codec = "latin-1"
+
+    return {
+        "codec": codec,
+        "bom": False,
+        "invalid_positions": invalid_positions,
+        "bytes_inspected": len(data)
+    }
+
+def sniff_file_encoding(file_info, num_bytes=SNIFF_BYTES):
+    """
+    Detects the encoding of a file by reading only its first block.
+
+    Args:
+        file_info (dict): Information about the file
+        num_bytes (int): Size of the prefix to inspect
+
+    Returns:
+        dict or None: Result of sniff_encoding, or None if the file is not a text file or its content is not available
+    """
+    if file_info.get("file_type", "").lower() not in TEXT_FILE_TYPES:
+        return None
+    source = open_decompressed_source(file_info)
+    if source is None:
+        return None
+    try:
+        prefix = source.read(num_bytes)
+    finally:
+        if source is not file_info.get("file_obj"):
+            source.close()
+    return sniff_encoding(prefix)
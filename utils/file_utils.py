@@ -1,5 +1,16 @@
+import io
 import os
+import re
+import codecs
+import threading
+import bz2
+import gzip
+import mmap
+import shutil
+import zipfile
+import subprocess
 import json
+import hashlib
 import random
 import pandas as pd
 from datetime import datetime
@@ -274,3 +285,319 @@ def update_performance_metric(current_avg, current_count, new_value):
     if current_count == 0:
         return new_value
     return (current_avg * (current_count - 1) + new_value) / current_count
+
+# File extensions accepted as attachments, mapped to the file types the agents process
+EXTENSION_FILE_TYPES = {"csv": "csv", "xlsx": "excel", "json": "json", "docx": "word", "pdf": "pdf", "zip": "archive"}
+
+# Compression suffixes accepted on top of a supported extension, e.g. claims.csv.gz
+COMPRESSION_EXTENSIONS = {"gz": "gzip", "bz2": "bz2"}
+
+# Multi-threaded command line decompressors, used instead of the standard library when installed
+PARALLEL_DECOMPRESSORS = {"gzip": ["pigz"], "bz2": ["lbzip2", "pbzip2"]}
+
+def split_compression(filename):
+    """
+    Splits the compression suffix off a file name.
+    
+    Returns:
+        tuple: (file name without the suffix, compression or None)
+    """
+    base, _, ext = filename.rpartition(".")
+    compression = COMPRESSION_EXTENSIONS.get(ext.lower()) if base else None
+    return (base, compression) if compression else (filename, None)
+
+def file_type_for(filename):
+    """
+    Returns the file type of a file name, or None if the extension is not supported.
+    """
+    filename, compression = split_compression(filename)
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    file_type = EXTENSION_FILE_TYPES.get(ext)
+    if compression and file_type == "archive":
+        return None  # Archives are read with random access, which a compressed stream does not offer
+    return file_type
+
+DATA_DIR = os.environ.get(
+    "AGENTIC_DEMO_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+)
+
+def get_data_dir(*parts):
+    """
+    Returns a directory under the local data folder, creating it if needed.
+    
+    Args:
+        *parts (str): Sub-directory names below the data folder
+        
+    Returns:
+        str: Absolute path of the directory
+    """
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def safe_key(value):
+    """
+    Turns a sender name or email address into a string that is safe to use as a file name.
+    """
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(value)).strip("._") or "unknown"
+
+class MappedFile(io.RawIOBase):
+    """
+    Read-only file object over a memory-mapped file, for readers that need the full io interface.
+    """
+    
+    def __init__(self, mapped):
+        self.mapped = mapped
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def read(self, size=-1):
+        return self.mapped.read(size)
+    
+    def readinto(self, buffer):
+        data = self.mapped.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.mapped.seek(offset, whence)
+        return self.mapped.tell()
+    
+    def tell(self):
+        return self.mapped.tell()
+    
+    def close(self):
+        if not self.closed:
+            self.mapped.close()
+        super().close()
+
+class DecompressedFile(io.RawIOBase):
+    """
+    Decompressing stream that also closes whatever it reads from when closed.
+    
+    at_eof tells on_close whether the reader got to the end of the content
+    or stopped early.
+    """
+    
+    def __init__(self, stream, on_close=None):
+        self.stream = stream
+        self.on_close = on_close
+        self.at_eof = False
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return self.stream.seekable()
+    
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if size is None or size < 0 or (not data and size != 0):
+            self.at_eof = True
+        return data
+    
+    def readinto(self, buffer):
+        count = self.stream.readinto(buffer)
+        if not count and len(buffer):
+            self.at_eof = True
+        return count
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.stream.seek(offset, whence)
+    
+    def tell(self):
+        return self.stream.tell()
+    
+    def close(self):
+        if not self.closed:
+            self.stream.close()
+            if self.on_close is not None:
+                self.on_close()
+        super().close()
+
+def _parallel_decompressor(compression):
+    return next((tool for tool in PARALLEL_DECOMPRESSORS[compression] if shutil.which(tool)), None)
+
+def open_decompressed_source(file_info):
+    """
+    Opens the content of a file, decompressing it as it is read if it is gzip or bzip2 compressed.
+    
+    The uncompressed file is never materialized. Compressed files on disk
+    that are read front to back (CSV and JSON) go through a multi-threaded
+    decompressor process when one is installed, which also overlaps the
+    decompression with parsing; everything else streams through the
+    standard library.
+    
+    Args:
+        file_info (dict): Information about the file
+        
+    Returns:
+        file-like object or None: Binary stream positioned at the start, or None if no content is available
+        
+    Raises:
+        OSError: On close, if the decompressor process failed, e.g. on a truncated file, after the content was read to the end
+    """
+    compression = file_info.get("compression")
+    source = open_file_source(file_info)
+    if source is None or compression is None:
+        return source
+    
+    def close_source():
+        if source is not file_info.get("file_obj"):
+            source.close()
+    
+    path = (file_info.get("blob") or {}).get("path") or file_info.get("file_path")
+    on_disk = file_info.get("archive_member") is None and file_info.get("file_obj") is None and path and os.path.isfile(path)
+    tool = _parallel_decompressor(compression)
+    if on_disk and tool and file_info.get("file_type") in ("csv", "json"):
+        close_source()
+        process = subprocess.Popen([tool, "-dc", path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        def stop_process():
+            if not decompressed.at_eof:
+                # The reader stopped early, e.g. after the prefix the encoding is sniffed from
+                process.kill()
+            process.wait()
+            message = process.stderr.read().decode("utf-8", errors="replace").strip()
+            process.stderr.close()
+            if decompressed.at_eof and process.returncode != 0:
+                # The output ends where the decompressor gave up, which would parse as a shorter file
+                raise OSError(f"{tool} exited with status {process.returncode} on {os.path.basename(path)}: {message}")
+        decompressed = DecompressedFile(process.stdout, on_close=stop_process)
+        return decompressed
+    
+    if compression == "gzip":
+        return DecompressedFile(gzip.GzipFile(fileobj=source, mode="rb"), on_close=close_source)
+    return DecompressedFile(bz2.BZ2File(source, mode="rb"), on_close=close_source)
+
+def open_file_source(file_info):
+    """
+    Opens the bytes behind a file: an archive member, a spooled blob, an uploaded file object or a path on disk.
+    
+    Blobs are mapped into memory read-only, so the operating system pages
+    the content in as it is read and no copy is kept on the Python heap.
+    Archive members are decompressed as they are read, without being
+    extracted first.
+    
+    Args:
+        file_info (dict): Information about the file
+        
+    Returns:
+        file-like object or None: Binary stream positioned at the start, or None if no content is available
+    """
+    member = file_info.get("archive_member")
+    if member is not None and os.path.isfile(member["archive_path"]):
+        archive = zipfile.ZipFile(member["archive_path"])
+        try:
+            # The archive file stays open until the member stream is closed
+            return archive.open(member["name"])
+        finally:
+            archive.close()
+    
+    blob = file_info.get("blob")
+    if blob is not None and os.path.isfile(blob["path"]):
+        f = open(blob["path"], "rb")
+        if blob["size"] == 0:
+            return f
+        with f:
+            return MappedFile(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    
+    file_obj = file_info.get("file_obj")
+    if file_obj is not None:
+        file_obj.seek(0)
+        return file_obj
+    
+    file_path = file_info.get("file_path")
+    if file_path and os.path.isfile(file_path):
+        return open(file_path, "rb")
+    
+    return None
+
+def hash_file_content(file_info, chunk_size=1024 * 1024):
+    """
+    Computes the SHA-256 of a file's content, reading it in chunks.
+    
+    Args:
+        file_info (dict): Information about the file
+        chunk_size (int): Number of bytes read at a time
+        
+    Returns:
+        str or None: Hex digest, or None if no content is available
+    """
+    source = open_file_source(file_info)
+    if source is None:
+        return None
+    
+    digest = hashlib.sha256()
+    try:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+    finally:
+        if source is not file_info.get("file_obj"):
+            source.close()
+    return digest.hexdigest()
+
+# Invalid byte sequences replaced by the load in progress on each thread
+_decode_errors = threading.local()
+
+def _replace_and_count(error):
+    replaced = getattr(_decode_errors, "replaced", None)
+    if replaced is not None:
+        replaced.append(error.start)
+    return ("\ufffd", error.end)
+
+codecs.register_error("replace-counted", _replace_and_count)
+
+def load_tabular_data(file_info, encoding=None, replaced=None):
+    """
+    Loads the content of a CSV, Excel or JSON file into a DataFrame.
+    
+    Args:
+        file_info (dict): Information about the file to load
+        encoding (str): Text encoding to decode CSV and JSON files with, e.g. from utils.encoding.sniff_file_encoding.
+            Bytes that are invalid in this encoding are replaced with U+FFFD rather than failing the load.
+        replaced (list): If given, receives an entry for every invalid byte sequence that was replaced,
+            including those beyond the prefix the encoding was sniffed from
+        
+    Returns:
+        pd.DataFrame or None: The loaded data, or None if the file is not a tabular file or its content is not available
+        
+    Raises:
+        ValueError: If the content cannot be parsed as the file type
+    """
+    file_type = file_info.get("file_type", "").lower()
+    if file_type not in ("csv", "excel", "json"):
+        return None
+    
+    source = open_decompressed_source(file_info)
+    if source is None:
+        return None
+    
+    _decode_errors.replaced = replaced
+    try:
+        try:
+            if file_type == "csv":
+                return pd.read_csv(source, encoding=encoding or "utf-8", encoding_errors="replace-counted")
+            if file_type == "excel":
+                return pd.read_excel(source)
+            
+            data = json.loads(source.read().decode(encoding or "utf-8", errors="replace-counted"))
+            if isinstance(data, dict):
+                # Use the first list of records if there is one, e.g. {"records": [...]}
+                records = next((value for value in data.values() if isinstance(value, list)), None)
+                data = records if records and isinstance(records[0], dict) else data
+            return pd.json_normalize(data)
+        finally:
+            # Closing reports a failed decompressor, so it counts as part of the load
+            if source is not file_info.get("file_obj"):
+                source.close()
+    except Exception as error:
+        # Callers tell malformed content apart from content that is not available
+        raise ValueError(f"Could not read {file_info.get('filename', 'the file')} as {file_type.upper()}: {str(error).strip()}") from error
+    finally:
+        _decode_errors.replaced = None
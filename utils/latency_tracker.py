@@ -0,0 +1,54 @@
+import math
+import threading
+from collections import deque
+from utils.shared import get_shared
+
+class LatencyTracker:
+    """
+    Sliding window of the most recent request latencies to one target system.
+
+    Percentiles are computed over the window, so they follow the system as
+    it gets faster or slower. Below min_samples the window says too little
+    about the tail and percentile returns the caller's default.
+    """
+
+    def __init__(self, window=500, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    def percentile(self, q, default=None):
+        """
+        Returns the q-th percentile (nearest rank) of the window.
+
+        Args:
+            q (float): Percentile between 0 and 100
+            default (float): Returned while there are fewer than min_samples latencies
+
+        Returns:
+            float: Latency in seconds
+        """
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return default
+            ordered = sorted(self.samples)
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+    def summary(self):
+        """Returns the number of requests seen and the p50, p95 and p99 of the window"""
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+def get_tracker(name):
+    """Returns the process-wide latency tracker of a target system"""
+    return get_shared("latency_tracker", name, LatencyTracker)
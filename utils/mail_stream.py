@@ -0,0 +1,301 @@
+import os
+import re
+import uuid
+import hashlib
+import binascii
+from email.parser import BytesFeedParser
+from email.policy import default as default_policy
+from email.utils import parseaddr
+from utils.file_utils import get_data_dir
+
+MAX_BODY_TEXT = 64 * 1024  # Inline text parts beyond this size are not kept in memory
+
+class _LineReader:
+    """Line iterator over a binary stream with one line of push-back"""
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.pushed = None
+
+    def next(self):
+        if self.pushed is not None:
+            line, self.pushed = self.pushed, None
+            return line
+        return next(self.lines, None)
+
+    def push_back(self, line):
+        self.pushed = line
+
+def _boundary_match(line, boundaries):
+    """Returns (boundary, is_closing) if the line is a delimiter of one of the open multiparts"""
+    if not line.startswith(b"--"):
+        return None
+    stripped = line.rstrip(b"\r\n \t")
+    for boundary in reversed(boundaries):
+        if stripped == b"--" + boundary:
+            return boundary, False
+        if stripped == b"--" + boundary + b"--":
+            return boundary, True
+    return None
+
+class _Base64Sink:
+    """Decodes base64 line by line, carrying incomplete quads over to the next line"""
+
+    def __init__(self, out):
+        self.out = out
+        self.pending = b""
+
+    def write(self, line):
+        data = self.pending + re.sub(rb"[^A-Za-z0-9+/=]", b"", line)
+        usable = len(data) - len(data) % 4
+        if usable:
+            self.out.write(binascii.a2b_base64(data[:usable]))
+        self.pending = data[usable:]
+
+    def close(self):
+        if self.pending:
+            self.out.write(binascii.a2b_base64(self.pending + b"=" * (-len(self.pending) % 4)))
+
+class _QuotedPrintableSink:
+    """Decodes quoted-printable line by line, dropping the line break that belongs to the next boundary"""
+
+    def __init__(self, out):
+        self.out = out
+        self.previous = None
+
+    def write(self, line):
+        if self.previous is not None:
+            self.out.write(binascii.a2b_qp(self.previous))
+        self.previous = line
+
+    def close(self):
+        if self.previous is not None:
+            self.out.write(binascii.a2b_qp(self.previous.rstrip(b"\r\n")))
+
+class _RawSink:
+    """Writes lines unchanged, dropping the line break that belongs to the next boundary"""
+
+    def __init__(self, out):
+        self.out = out
+        self.previous = None
+
+    def write(self, line):
+        if self.previous is not None:
+            self.out.write(self.previous)
+        self.previous = line
+
+    def close(self):
+        if self.previous is not None:
+            self.out.write(self.previous.rstrip(b"\r\n"))
+
+class _BoundedBuffer:
+    """In-memory sink for inline text that stops growing past a limit"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        if self.size < self.limit:
+            self.chunks.append(data[:self.limit - self.size])
+            self.size += len(self.chunks[-1])
+
+    def getvalue(self):
+        return b"".join(self.chunks)
+
+class _HashingFile:
+    """Spool file that computes the SHA-256 of the decoded bytes as they are written"""
+
+    def __init__(self, path):
+        self.f = open(path, "wb")
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        self.f.write(data)
+
+    def close(self):
+        self.f.close()
+
+def _read_headers(reader):
+    """Feed header lines to the stdlib feed parser until the blank line that ends them"""
+    parser = BytesFeedParser(policy=default_policy)
+    while True:
+        line = reader.next()
+        if line is None:
+            break
+        parser.feed(line)
+        if line in (b"\r\n", b"\n"):
+            break
+    return parser.close()
+
+def _parse_part(reader, boundaries, spool_dir, result):
+    headers = _read_headers(reader)
+
+    if headers.get_content_maintype() == "multipart":
+        boundary = headers.get_param("boundary")
+        if boundary:
+            _parse_multipart(reader, boundaries + [boundary.encode()], spool_dir, result)
+            return headers
+
+    filename = headers.get_filename()
+    is_attachment = filename is not None or headers.get_content_disposition() == "attachment"
+    encoding = (headers.get("Content-Transfer-Encoding") or "7bit").strip().lower()
+
+    if is_attachment:
+        path = os.path.join(spool_dir, uuid.uuid4().hex)
+        out = _HashingFile(path)
+    else:
+        out = _BoundedBuffer(MAX_BODY_TEXT)
+
+    if encoding == "base64":
+        sink = _Base64Sink(out)
+    elif encoding == "quoted-printable":
+        sink = _QuotedPrintableSink(out)
+    else:
+        sink = _RawSink(out)
+
+    # Stream the body until the next delimiter of an enclosing multipart
+    try:
+        while True:
+            line = reader.next()
+            if line is None:
+                break
+            if boundaries and _boundary_match(line, boundaries):
+                reader.push_back(line)
+                break
+            sink.write(line)
+        sink.close()
+    finally:
+        if is_attachment:
+            out.close()
+
+    if is_attachment:
+        result["attachments"].append({
+            "filename": os.path.basename(filename or f"attachment_{len(result['attachments']) + 1}"),
+            "content_type": headers.get_content_type(),
+            "path": path,
+            "size": os.path.getsize(path),
+            "content_hash": out.digest.hexdigest()
+        })
+    elif headers.get_content_type() == "text/plain" and not result["body"]:
+        charset = headers.get_content_charset() or "utf-8"
+        result["body"] = out.getvalue().decode(charset, errors="replace")
+    return headers
+
+def _parse_multipart(reader, boundaries, spool_dir, result):
+    boundary = boundaries[-1]
+
+    # Skip the preamble up to the first delimiter
+    while True:
+        line = reader.next()
+        if line is None:
+            return
+        match = _boundary_match(line, boundaries)
+        if match:
+            if match[0] != boundary:
+                reader.push_back(line)
+                return
+            if match[1]:
+                break
+            _parse_part(reader, boundaries, spool_dir, result)
+            break
+
+    # Parse the parts that follow each delimiter until the closing delimiter
+    while True:
+        line = reader.next()
+        if line is None:
+            return
+        match = _boundary_match(line, boundaries)
+        if match is None:
+            continue
+        if match[0] != boundary:
+            reader.push_back(line)
+            return
+        if match[1]:
+            break
+        _parse_part(reader, boundaries, spool_dir, result)
+
+    # Skip the epilogue up to the enclosing multipart's next delimiter
+    while True:
+        line = reader.next()
+        if line is None:
+            return
+        if len(boundaries) > 1 and _boundary_match(line, boundaries[:-1]):
+            reader.push_back(line)
+            return
+
+def parse_message(lines, spool_dir=None):
+    """
+    Parses a MIME message from a stream of lines, decoding attachments straight to disk.
+
+    Headers of the message and of each part go through the stdlib feed
+    parser, while part bodies are decoded line by line into spool files,
+    so an attachment is never held in memory, encoded or decoded. The
+    SHA-256 of each attachment is computed on the way to disk.
+
+    Args:
+        lines (iterable): Binary lines of the message, e.g. an open file
+        spool_dir (str): Directory for the decoded attachments
+
+    Returns:
+        dict: Message headers, plain text body and the spooled attachments
+    """
+    spool_dir = spool_dir or get_data_dir("attachments")
+    result = {"headers": None, "body": "", "attachments": []}
+    result["headers"] = _parse_part(_LineReader(lines), [], spool_dir, result)
+    return result
+
+def iter_maildir(path):
+    """
+    Yields the message files of a Maildir, oldest name first.
+
+    Args:
+        path (str): Maildir root containing new/ and cur/
+    """
+    for sub_dir in ("cur", "new"):
+        folder = os.path.join(path, sub_dir)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.startswith("."):
+                yield os.path.join(folder, name)
+
+def iter_mbox(f):
+    """
+    Splits an open mbox file into messages without reading it whole.
+
+    Yields:
+        generator: Lines of one message; consume it before asking for the next message
+    """
+    reader = _LineReader(f)
+
+    def message_lines():
+        while True:
+            line = reader.next()
+            if line is None:
+                return
+            if line.startswith(b"From "):
+                reader.push_back(line)
+                return
+            # Undo mboxrd quoting of body lines that start with "From "
+            if line.startswith(b">") and line.lstrip(b">").startswith(b"From "):
+                line = line[1:]
+            yield line
+
+    while True:
+        line = reader.next()
+        if line is None:
+            return
+        if not line.startswith(b"From "):
+            continue
+        lines = message_lines()
+        yield lines
+        for _ in lines:  # Skip whatever the caller did not consume
+            pass
+
+def sender_details(headers):
+    """Returns (display name, email address) of a message's sender"""
+    name, address = parseaddr(str(headers.get("From", "")))
+    return name or address, address
@@ -0,0 +1,196 @@
+import os
+import json
+import uuid
+import threading
+import numpy as np
+from collections import OrderedDict
+from utils.file_utils import get_data_dir
+from utils.shared import get_shared
+
+NUM_PERM = 128
+NUM_BANDS = 16  # 16 bands of 8 rows: files above ~0.7 similarity collide in at least one band
+
+_rng = np.random.default_rng(20250101)
+_SALTS = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+
+def _mix(values):
+    """splitmix64 finalizer, applied element-wise with wrap-around uint64 arithmetic"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def minhash_signature(row_hashes, chunk_size=8192):
+    """
+    Computes the MinHash signature of a file from its row hashes.
+
+    Args:
+        row_hashes (np.ndarray): uint64 row hashes, e.g. from utils.dedupe.hash_rows
+        chunk_size (int): Number of rows mixed at once, bounding memory to chunk_size * NUM_PERM values
+
+    Returns:
+        np.ndarray: uint64 signature of length NUM_PERM
+    """
+    signature = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    row_hashes = np.asarray(row_hashes, dtype=np.uint64)
+    for start in range(0, len(row_hashes), chunk_size):
+        chunk = row_hashes[start:start + chunk_size]
+        mixed = _mix(chunk[:, None] ^ _SALTS[None, :])
+        np.minimum(signature, mixed.min(axis=0), out=signature)
+    return signature
+
+def estimate_similarity(signature_a, signature_b):
+    """Estimates the Jaccard similarity of two files' row sets from their signatures"""
+    return float(np.mean(signature_a == signature_b))
+
+class NearDuplicateIndex:
+    """
+    Persistent LSH index over the MinHash signatures of recent submissions.
+
+    Each signature is split into bands and every band is hashed into a bucket,
+    so a lookup only compares against submissions sharing a bucket instead of
+    scanning the whole history. The row hashes of each indexed submission are
+    kept next to the index so that near-duplicates can be processed as a delta.
+    One index is shared by all sessions, see get_near_duplicate_index, so a
+    lookup and the insert that follows it run under one lock.
+    """
+
+    def __init__(self, directory=None, max_entries=500, threshold=0.8):
+        self.directory = directory or get_data_dir("near_duplicates")
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.rows_per_band = NUM_PERM // NUM_BANDS
+        self.entries = OrderedDict()  # entry id -> {"sender", "filename", "signature"}
+        self.buckets = {}  # (band, band bytes) -> set of entry ids
+        self.lock = threading.Lock()
+        self._load()
+
+    def _index_path(self):
+        return os.path.join(self.directory, "index.json")
+
+    def _rows_path(self, entry_id):
+        return os.path.join(self.directory, f"{entry_id}.npy")
+
+    def _band_keys(self, signature):
+        size = self.rows_per_band
+        return [(band, signature[band * size:(band + 1) * size].tobytes()) for band in range(NUM_BANDS)]
+
+    def _load(self):
+        if not os.path.exists(self._index_path()):
+            return
+        with open(self._index_path()) as f:
+            stored = json.load(f)
+        for entry in stored:
+            signature = np.array([int(v) for v in entry["signature"]], dtype=np.uint64)
+            self._insert(entry["id"], entry["sender"], entry["filename"], signature)
+
+    def _save(self):
+        stored = [
+            {
+                "id": entry_id,
+                "sender": entry["sender"],
+                "filename": entry["filename"],
+                "signature": [str(v) for v in entry["signature"]]
+            }
+            for entry_id, entry in self.entries.items()
+        ]
+        tmp_path = f"{self._index_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(stored, f)
+        os.replace(tmp_path, self._index_path())
+
+    def _insert(self, entry_id, sender, filename, signature):
+        self.entries[entry_id] = {"sender": sender, "filename": filename, "signature": signature}
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, set()).add(entry_id)
+
+    def _evict_oldest(self):
+        entry_id, entry = self.entries.popitem(last=False)
+        for key in self._band_keys(entry["signature"]):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self.buckets[key]
+        if os.path.exists(self._rows_path(entry_id)):
+            os.remove(self._rows_path(entry_id))
+
+    def find(self, sender, signature):
+        """
+        Finds the most similar earlier submission from the same sender.
+
+        Args:
+            sender (str): Sender of the new submission
+            signature (np.ndarray): MinHash signature of the new submission
+
+        Returns:
+            tuple or None: (entry id, estimated similarity) of the best match above the threshold
+        """
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates |= self.buckets.get(key, set())
+
+        best = None
+        for entry_id in candidates:
+            entry = self.entries[entry_id]
+            if entry["sender"] != sender:
+                continue
+            similarity = estimate_similarity(signature, entry["signature"])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (entry_id, similarity)
+        return best
+
+    def add(self, sender, filename, signature, row_hashes):
+        """
+        Indexes a submission, evicting the oldest ones beyond max_entries.
+
+        Returns:
+            str: Id of the new index entry
+        """
+        entry_id = uuid.uuid4().hex
+        np.save(self._rows_path(entry_id), np.unique(row_hashes))
+        self._insert(entry_id, sender, filename, signature)
+        while len(self.entries) > self.max_entries:
+            self._evict_oldest()
+        self._save()
+        return entry_id
+
+    def match_and_add(self, sender, filename, row_hashes):
+        """
+        Looks up a near-duplicate of a submission and then indexes the submission.
+
+        Args:
+            sender (str): Sender of the submission
+            filename (str): Name of the submitted file
+            row_hashes (np.ndarray): Row hashes of the submission
+
+        Returns:
+            dict or None: Details of the near-duplicate, including the rows that changed
+        """
+        if len(row_hashes) == 0:
+            return None
+
+        signature = minhash_signature(row_hashes)
+        with self.lock:
+            match = self.find(sender, signature)
+
+            near_duplicate = None
+            if match is not None:
+                entry_id, similarity = match
+                previous_rows = np.load(self._rows_path(entry_id))
+                changed = ~np.isin(row_hashes, previous_rows)
+                near_duplicate = {
+                    "previous_filename": self.entries[entry_id]["filename"],
+                    "similarity": similarity,
+                    "changed_rows": np.flatnonzero(changed).tolist(),
+                    "unchanged_count": int(len(row_hashes) - changed.sum())
+                }
+
+            self.add(sender, filename, signature, row_hashes)
+        return near_duplicate
+
+def get_near_duplicate_index(directory=None):
+    """Returns the process-wide near-duplicate index of a directory, loaded from disk on first use"""
+    directory = os.path.abspath(directory or get_data_dir("near_duplicates"))
+    return get_shared("near_duplicate_index", directory, lambda: NearDuplicateIndex(directory))
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from itertools import islice
+from utils.file_utils import get_data_dir
+from utils.retry import backoff_delay
+from utils.shared import get_shared
+
+# Delivery attempts before an upload to a system is given up and marked failed
+MAX_DELIVERY_ATTEMPTS = 10
+
+# Rows read back from or written to the outbox per statement
+RECORD_CHUNK_SIZE = 5000
+
+class UploadOutbox:
+    """
+    Durable write-ahead log of the uploads still to be delivered to target systems.
+
+    A load is recorded with its common-format rows and one delivery per
+    target system in a single transaction, before anything is sent, so
+    work the pipeline finished survives a crash and is delivered exactly
+    once by idempotency key after a restart. Rows of a load are removed
+    once none of its deliveries is pending any more.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_data_dir("outbox"), "outbox.sqlite3")
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # The outbox is the only copy of pending work, so every commit reaches the disk
+        self.connection.execute("PRAGMA synchronous=FULL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS loads ("
+                "load_id TEXT PRIMARY KEY, file_id TEXT, filename TEXT NOT NULL, sender TEXT NOT NULL, "
+                "total_records INTEGER NOT NULL, has_rows INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS load_records ("
+                "load_id TEXT NOT NULL, seq INTEGER NOT NULL, row_number INTEGER NOT NULL, record TEXT NOT NULL, "
+                "PRIMARY KEY (load_id, seq)) WITHOUT ROWID"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS deliveries ("
+                "delivery_id INTEGER PRIMARY KEY AUTOINCREMENT, load_id TEXT NOT NULL, system TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_attempt_at REAL NOT NULL, result TEXT, updated_at REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS deliveries_pending ON deliveries (status, next_attempt_at)"
+            )
+
+    def enqueue(self, load_id, file_id, filename, sender, systems, total_records, records=None):
+        """
+        Records a load and its deliveries durably.
+
+        Args:
+            load_id (str): Identifier of the load, the idempotency key of its uploads
+            file_id (str): ID of the file in the pipeline
+            filename (str): Source file name
+            sender (str): Sender of the source file
+            systems (list): Names of the target systems
+            total_records (int): Number of records in the load
+            records (iterable): (row number, JSON document) pairs, None if the load has no readable rows
+
+        Returns:
+            list: Delivery ID per target system, in the order of systems
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO loads (load_id, file_id, filename, sender, total_records, has_rows, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (load_id, file_id, filename, sender, total_records, records is not None, now)
+            )
+            if records is not None:
+                records = iter(records)
+                seq = 0
+                while True:
+                    chunk = list(islice(records, RECORD_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    self.connection.executemany(
+                        "INSERT INTO load_records (load_id, seq, row_number, record) VALUES (?, ?, ?, ?)",
+                        ((load_id, seq + i, row_number, record) for i, (row_number, record) in enumerate(chunk))
+                    )
+                    seq += len(chunk)
+            return [
+                self.connection.execute(
+                    "INSERT INTO deliveries (load_id, system, next_attempt_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (load_id, system, now, now)
+                ).lastrowid
+                for system in systems
+            ]
+
+    def take_pending(self, limit):
+        """
+        Returns the deliveries that are due, oldest first.
+
+        Returns:
+            list: Deliveries with delivery_id, load_id, system, attempts and the load's file_id,
+                filename, sender, total_records and has_rows
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT d.delivery_id, d.load_id, d.system, d.attempts, l.file_id, l.filename, l.sender, "
+                "l.total_records, l.has_rows FROM deliveries d JOIN loads l ON l.load_id = d.load_id "
+                "WHERE d.status = 'pending' AND d.next_attempt_at <= ? ORDER BY d.delivery_id LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+        keys = ("delivery_id", "load_id", "system", "attempts", "file_id", "filename", "sender", "total_records", "has_rows")
+        return [dict(zip(keys, row), has_rows=bool(row[-1])) for row in rows]
+
+    def records(self, load_id):
+        """Reads the rows of a load back as (row number, JSON document) pairs, a chunk at a time"""
+        seq = 0
+        while True:
+            with self.lock:
+                chunk = self.connection.execute(
+                    "SELECT row_number, record FROM load_records WHERE load_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                    (load_id, seq, RECORD_CHUNK_SIZE)
+                ).fetchall()
+            if not chunk:
+                return
+            yield from chunk
+            seq += len(chunk)
+
+    def settle(self, outcomes):
+        """
+        Confirms or reschedules a batch of delivery attempts in one transaction.
+
+        A failed delivery is retried after a backoff that grows with its
+        attempts, and marked failed after MAX_DELIVERY_ATTEMPTS.
+
+        Args:
+            outcomes (list): (delivery ID, JSON-serializable result, delivered) triples
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            for delivery_id, result, delivered in outcomes:
+                if delivered:
+                    self.connection.execute(
+                        "UPDATE deliveries SET status = 'delivered', attempts = attempts + 1, result = ?, updated_at = ? "
+                        "WHERE delivery_id = ?",
+                        (json.dumps(result), now, delivery_id)
+                    )
+                    continue
+                attempts = self.connection.execute(
+                    "SELECT attempts FROM deliveries WHERE delivery_id = ?", (delivery_id,)
+                ).fetchone()[0] + 1
+                self.connection.execute(
+                    "UPDATE deliveries SET status = ?, attempts = ?, next_attempt_at = ?, result = ?, updated_at = ? "
+                    "WHERE delivery_id = ?",
+                    (
+                        "failed" if attempts >= MAX_DELIVERY_ATTEMPTS else "pending",
+                        attempts,
+                        now + backoff_delay(attempts - 1, base=1.0, cap=60.0),
+                        json.dumps(result),
+                        now,
+                        delivery_id
+                    )
+                )
+            # Rows are only needed while a delivery of their load is pending
+            self.connection.execute(
+                "DELETE FROM load_records WHERE load_id IN (SELECT load_id FROM loads WHERE has_rows = 1 "
+                "AND NOT EXISTS (SELECT 1 FROM deliveries WHERE deliveries.load_id = loads.load_id AND status = 'pending'))"
+            )
+            self.connection.execute(
+                "UPDATE loads SET has_rows = 0 WHERE has_rows = 1 "
+                "AND NOT EXISTS (SELECT 1 FROM deliveries WHERE deliveries.load_id = loads.load_id AND status = 'pending')"
+            )
+
+    def settled_since(self, since):
+        """
+        Returns the deliveries confirmed or given up after a point in time, oldest first.
+
+        Args:
+            since (float): Unix timestamp
+
+        Returns:
+            list: Deliveries with file_id, filename, system, status, result and updated_at
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT l.file_id, l.filename, d.system, d.status, d.result, d.updated_at "
+                "FROM deliveries d JOIN loads l ON l.load_id = d.load_id "
+                "WHERE d.status != 'pending' AND d.updated_at > ? ORDER BY d.updated_at",
+                (since,)
+            ).fetchall()
+        return [
+            {"file_id": row[0], "filename": row[1], "system": row[2], "status": row[3],
+             "result": json.loads(row[4]) if row[4] else None, "updated_at": row[5]}
+            for row in rows
+        ]
+
+    def stats(self):
+        """Number of deliveries per status"""
+        with self.lock:
+            counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM deliveries GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("pending", "delivered", "failed")}
+
+class OutboxRelay:
+    """
+    Background thread that drains the outbox and confirms what was delivered.
+
+    Due deliveries are taken in batches of batch_size, handed to deliver,
+    and settled together, so the pipeline only pays for the durable write
+    and upload throughput no longer holds up the files behind it. Pending
+    deliveries left by an earlier process are picked up when the relay
+    starts.
+
+    Args:
+        deliver (callable): Called with a list of deliveries, returns (delivery ID, result, delivered) triples
+    """
+
+    def __init__(self, outbox, deliver, batch_size=20, interval=1.0):
+        self.outbox = outbox
+        self.deliver = deliver
+        self.batch_size = batch_size
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.woken = False
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.notify()
+        self.thread.join()
+
+    def notify(self):
+        """Wakes the relay up after a load was enqueued"""
+        with self.condition:
+            self.woken = True
+            self.condition.notify()
+
+    def _run(self):
+        while self.running:
+            deliveries = self.outbox.take_pending(self.batch_size)
+            if not deliveries:
+                with self.condition:
+                    if not self.woken:
+                        self.condition.wait(timeout=self.interval)
+                    self.woken = False
+                continue
+            try:
+                outcomes = self.deliver(deliveries)
+            except Exception as e:
+                # Keep the relay alive, the deliveries are retried after a backoff
+                outcomes = [(delivery["delivery_id"], {"error": str(e)}, False) for delivery in deliveries]
+            self.outbox.settle(outcomes)
+
+def get_relay(outbox, deliver):
+    """Returns the process-wide relay of an outbox, starting it on first use"""
+    def create():
+        relay = OutboxRelay(outbox, deliver)
+        relay.start()
+        return relay
+    return get_shared("outbox_relay", os.path.abspath(outbox.path), create)
@@ -0,0 +1,203 @@
+import io
+import os
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from utils.file_utils import get_data_dir
+from utils.shared import get_shared
+
+# Block size used when checksumming the part of a table file that was already indexed
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
+def _key_strings(values):
+    """
+    Key values as stripped strings, with whole floats written as integers.
+
+    A numeric ID column with a missing value is read as float, so 1001 arrives
+    as 1001.0 and would never match "1001" in a table.
+    """
+    series = pd.Series(values).dropna()
+    if pd.api.types.is_float_dtype(series):
+        floats = series.to_numpy(dtype=np.float64)
+        integral = (np.floor(floats) == floats) & (np.abs(floats) < 2 ** 63)
+        keys = series.astype(str)
+        keys[integral] = floats[integral].astype(np.int64).astype(str)
+    else:
+        keys = series.astype(object)
+        is_float = (keys.map(type) == float).to_numpy()
+        if is_float.any():
+            keys[is_float] = _key_strings(keys[is_float].astype(np.float64)).to_numpy(dtype=object)
+        keys = keys.astype(str)
+    return keys.str.strip()
+
+def hash_keys(values):
+    """
+    Hashes reference keys to uint64 so that a table of millions of keys costs 8 bytes per key.
+
+    Keys are compared as stripped strings, so 1001 or 1001.0 in a numeric column matches "1001" in a table.
+    """
+    keys = _key_strings(values)
+    return pd.util.hash_array(keys.to_numpy(dtype=object), categorize=False).astype(np.uint64)
+
+def column_key_hashes(values):
+    """
+    Hashes the keys of a column to look up, the part of a lookup that does not depend on the table.
+
+    Args:
+        values (pd.Series): Values to look up
+
+    Returns:
+        tuple: Boolean mask of the present values and the np.ndarray of their key hashes
+    """
+    series = pd.Series(values, dtype=object)
+    present = series.notna().to_numpy()
+    if not present.any():
+        return present, np.empty(0, dtype=np.uint64)
+    return present, hash_keys(series[present])
+
+class ReferenceIndex:
+    """
+    Sorted array of hashed keys answering membership for a whole column with one binary search.
+    """
+
+    def __init__(self, hashes=None):
+        self.hashes = np.unique(hashes) if hashes is not None else np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, hashes):
+        """Merge new key hashes into the index"""
+        self.hashes = np.union1d(self.hashes, hashes).astype(np.uint64)
+
+    def contains(self, values):
+        """
+        Vectorized membership test.
+
+        Args:
+            values (pd.Series): Values to look up, missing values are never members
+
+        Returns:
+            np.ndarray: Boolean mask, True where the value is a known key
+        """
+        return self.contains_hashes(*column_key_hashes(values))
+
+    def contains_hashes(self, present, hashes):
+        """Membership test on the output of column_key_hashes"""
+        result = np.zeros(len(present), dtype=bool)
+        if not present.any() or len(self.hashes) == 0:
+            return result
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        result[present] = self.hashes[positions] == hashes
+        return result
+
+class ReferenceDataStore:
+    """
+    Reference tables (product catalogs, customer IDs, policy numbers) loaded from local files.
+
+    Each table is a file named <table>.csv in the reference data directory,
+    with a header row and the key in the first column. Files are only read
+    again when they change. A file that grew is read from where the previous
+    load stopped if the part indexed before is unchanged, which is checked
+    against a checksum, otherwise the table is rebuilt.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or get_data_dir("reference")
+        self.indexes = {}
+        self.file_state = {}  # table -> (mtime, size, bytes indexed, checksum of the bytes indexed)
+        self.lock = threading.Lock()
+
+    def _path(self, table):
+        return os.path.join(self.directory, f"{table}.csv")
+
+    def tables(self):
+        """Names of the available reference tables"""
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith(".csv"))
+
+    def _load_full(self, table, path):
+        """
+        Index the whole file.
+
+        Returns:
+            tuple: Offset after the last complete line and the checksum of the bytes before it
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        keys = pd.read_csv(io.BytesIO(data), usecols=[0], dtype=str, keep_default_na=False).iloc[:, 0]
+        self.indexes[table] = ReferenceIndex(hash_keys(keys))
+        # An unterminated last line is indexed now and read again once the rest of it is appended
+        end = data.rfind(b"\n") + 1
+        return end, hashlib.blake2b(data[:end], digest_size=16).hexdigest()
+
+    def _load_tail(self, table, path, offset, checksum):
+        """
+        Read the keys appended after offset, up to the last complete line.
+
+        Returns:
+            tuple or None: New offset and checksum, or None if the bytes before offset changed
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            remaining = offset
+            while remaining > 0:
+                block = f.read(min(CHECKSUM_BLOCK_SIZE, remaining))
+                if not block:
+                    return None
+                digest.update(block)
+                remaining -= len(block)
+            if digest.hexdigest() != checksum:
+                return None
+            tail = f.read()
+        end = tail.rfind(b"\n") + 1
+        if end:
+            keys = pd.read_csv(io.BytesIO(tail[:end]), header=None, usecols=[0], dtype=str, keep_default_na=False)
+            self.indexes[table].add(hash_keys(keys.iloc[:, 0]))
+            digest.update(tail[:end])
+        return offset + end, digest.hexdigest()
+
+    def refresh(self):
+        """Load new tables and bring changed ones up to date"""
+        with self.lock:
+            self._refresh()
+
+    def _refresh(self):
+        for table in self.tables():
+            path = self._path(table)
+            stat = os.stat(path)
+            state = self.file_state.get(table)
+            if state is not None and state[:2] == (stat.st_mtime, stat.st_size):
+                continue
+            loaded = None
+            if state is not None and stat.st_size > state[1] and table in self.indexes:
+                loaded = self._load_tail(table, path, state[2], state[3])
+            if loaded is None:
+                # A new table, or one that was rewritten rather than appended to
+                loaded = self._load_full(table, path)
+            self.file_state[table] = (stat.st_mtime, stat.st_size) + loaded
+
+    def has_table(self, table):
+        return table in self.indexes and len(self.indexes[table]) > 0
+
+    def contains(self, table, values):
+        """
+        Tests a whole column against a reference table.
+
+        Args:
+            table (str): Name of the reference table
+            values (pd.Series): Column to look up
+
+        Returns:
+            np.ndarray: Boolean mask, True where the value exists in the table
+        """
+        return self.indexes[table].contains(values)
+
+    def contains_hashes(self, table, present, hashes):
+        """Tests a column hashed with column_key_hashes against a reference table, see contains"""
+        return self.indexes[table].contains_hashes(present, hashes)
+
+def get_reference_data(directory=None):
+    """Returns the process-wide reference data store of a directory, so each table is indexed once"""
+    directory = os.path.abspath(directory or get_data_dir("reference"))
+    return get_shared("reference_data", directory, lambda: ReferenceDataStore(directory))
@@ -0,0 +1,21 @@
+import random
+
+# Retries after the first attempt before an operation is given up
+MAX_RETRIES = 5
+
+def backoff_delay(attempt, base=0.05, cap=2.0):
+    """
+    Seconds to wait before a retry, exponential backoff with full jitter.
+
+    The wait is drawn uniformly below the exponential bound, so clients
+    that failed together do not all retry together.
+
+    Args:
+        attempt (int): Number of failed attempts so far, minus one
+        base (float): Bound of the first wait in seconds
+        cap (float): Largest bound in seconds
+
+    Returns:
+        float: Seconds to sleep
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
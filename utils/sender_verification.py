@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from utils.file_utils import get_data_dir
+from utils.shared import get_shared
+
+# Partners known out of the box: sender domain -> partner name
+DEFAULT_PARTNERS = {
+    "acmeinsurance.com": "Acme Insurance",
+    "globalre.com": "Global Reinsurance",
+    "citybenefits.com": "City Benefits Corp",
+    "metrohealth.org": "Metro Health Partners",
+    "securefinancial.com": "Secure Financial"
+}
+
+# Addresses and domains accepted without further checks
+DEFAULT_ALLOW_LIST = {"user@local", "drop@local"}
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after a time to live.
+
+    Negative results get their own, shorter TTL, so a sender that failed
+    verification is not looked up again on every email, but a fixed DNS
+    record or a new partner is picked up soon.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, negative_ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = OrderedDict()  # key -> (expires at, value)
+        self.lock = threading.Lock()
+
+    def get(self, key, now=None):
+        """Returns the cached value, or None if the key is missing or expired"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, negative=False, now=None):
+        """Stores a value, evicting the least recently used entry beyond max_entries"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.entries[key] = (now + (self.negative_ttl if negative else self.ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class LocalAuthRecords:
+    """
+    Local stand-in for the DNS lookups behind SPF and DKIM checks.
+
+    Results are read from auth_records.json in the verification data
+    directory ({domain: {"spf": "pass", "dkim": "pass"}}). Registered
+    partners that are not listed pass both checks.
+    """
+
+    def __init__(self, directory, partners):
+        self.path = os.path.join(directory, "auth_records.json")
+        self.partners = partners
+
+    def lookup(self, domain):
+        """
+        Returns the SPF and DKIM results of a sender domain.
+
+        Returns:
+            dict: {"spf": ..., "dkim": ...}, each "pass", "fail" or "none"
+        """
+        records = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                records = json.load(f)
+        default = "pass" if domain in self.partners else "none"
+        record = records.get(domain, {})
+        return {"spf": record.get("spf", default), "dkim": record.get("dkim", default)}
+
+class SenderVerifier:
+    """
+    Verifies email senders against the allow-list, SPF/DKIM results and the partner registry.
+
+    The allow-list is checked in memory on every call. The other checks
+    work per sender domain and their outcome is cached, so a burst of
+    emails from a few partners costs one lookup per partner.
+    """
+
+    def __init__(self, directory=None, cache=None):
+        self.directory = directory or get_data_dir("sender_verification")
+        self.cache = cache if cache is not None else get_shared("sender_verification_cache", None, TTLCache)
+        self.allow_list = set(DEFAULT_ALLOW_LIST)
+        self.partners = dict(DEFAULT_PARTNERS)
+
+        allow_list_path = os.path.join(self.directory, "allow_list.txt")
+        if os.path.exists(allow_list_path):
+            with open(allow_list_path) as f:
+                self.allow_list.update(line.strip().lower() for line in f if line.strip())
+
+        partners_path = os.path.join(self.directory, "partners.json")
+        if os.path.exists(partners_path):
+            with open(partners_path) as f:
+                self.partners.update(json.load(f))
+
+        self.auth_records = LocalAuthRecords(self.directory, self.partners)
+
+    def verify(self, sender_email):
+        """
+        Verifies the sender of an email.
+
+        Args:
+            sender_email (str): Address the email was sent from
+
+        Returns:
+            dict: verified, partner name, reason, and source ("local", "cache" or "lookup")
+        """
+        address = (sender_email or "").strip().lower()
+        domain = address.rsplit("@", 1)[-1] if "@" in address else ""
+        if address in self.allow_list or domain in self.allow_list:
+            return {"verified": True, "partner": self.partners.get(domain), "reason": "allow-listed", "source": "local"}
+        if not domain:
+            return {"verified": False, "partner": None, "reason": "no sender address", "source": "local"}
+
+        cached = self.cache.get(domain)
+        if cached is not None:
+            return dict(cached, source="cache")
+
+        auth = self.auth_records.lookup(domain)
+        partner = self.partners.get(domain)
+        if auth["spf"] != "pass" or auth["dkim"] != "pass":
+            result = {"verified": False, "partner": partner, "reason": f"SPF {auth['spf']}, DKIM {auth['dkim']}"}
+        elif partner is None:
+            result = {"verified": False, "partner": None, "reason": "not a registered partner"}
+        else:
+            result = {"verified": True, "partner": partner, "reason": "SPF and DKIM pass"}
+        self.cache.put(domain, result, negative=not result["verified"])
+        return dict(result, source="lookup")
@@ -0,0 +1,26 @@
+import threading
+
+_instances = {}
+_instances_lock = threading.RLock()
+
+def get_shared(kind, key, create):
+    """
+    Returns the process-wide object of a kind under a key, creating it on first use.
+
+    Streamlit runs the app script again on every interaction, and the agents
+    with it, so state that builds up across files (open connections, row
+    filters, indexes, background threads) is kept here for the life of the
+    process instead of on an agent.
+
+    Args:
+        kind (str): What the object is, e.g. "pool", keeps keys of different kinds apart
+        key (hashable): Identifies the object within its kind, e.g. a system name or a directory
+        create (callable): Called without arguments to create the object the first time
+
+    Returns:
+        object: The shared object
+    """
+    with _instances_lock:
+        if (kind, key) not in _instances:
+            _instances[(kind, key)] = create()
+        return _instances[(kind, key)]
@@ -0,0 +1,216 @@
+import os
+import json
+import math
+import threading
+import numpy as np
+from utils.file_utils import get_data_dir, safe_key
+from utils.shared import get_shared
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative accuracy guarantees (DDSketch style).
+
+    Values are counted in logarithmically sized bins, so any quantile is
+    returned within relative_accuracy of the true value while the sketch
+    stays at a few kilobytes however many values it has seen. Two sketches
+    with the same accuracy merge by adding their bin counts.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=1024):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}  # bin index -> count
+        self.negative = {}  # bin index of abs(value) -> count
+        self.zero_count = 0
+        self.count = 0
+
+    def _add_bins(self, store, values):
+        indexes = np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+        keys, counts = np.unique(indexes, return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + count
+        self._collapse(store)
+
+    def _collapse(self, store):
+        """Fold the lowest bins together once the bin budget is exceeded"""
+        if len(store) <= self.max_bins:
+            return
+        keys = sorted(store)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        folded = sum(store.pop(key) for key in excess)
+        store[excess[-1]] = folded
+
+    def update(self, values):
+        """
+        Adds an array of values to the sketch in one vectorized pass.
+
+        Args:
+            values (np.ndarray): Numeric values, NaNs are ignored
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.zero_count += int(np.count_nonzero(values == 0))
+        if (values > 0).any():
+            self._add_bins(self.positive, values[values > 0])
+        if (values < 0).any():
+            self._add_bins(self.negative, -values[values < 0])
+
+    def merge(self, other):
+        """Merges another sketch with the same relative accuracy into this one"""
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+            self._collapse(store)
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def _bin_value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        """
+        Estimates the value at quantile q.
+
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float or None: Estimated value, or None if the sketch is empty
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._bin_value(key)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._bin_value(key)
+        return self._bin_value(max(self.positive)) if self.positive else 0.0
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "positive": {str(k): v for k, v in self.positive.items()},
+            "negative": {str(k): v for k, v in self.negative.items()},
+            "zero_count": self.zero_count,
+            "count": self.count
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"], data["max_bins"])
+        sketch.positive = {int(k): v for k, v in data["positive"].items()}
+        sketch.negative = {int(k): v for k, v in data["negative"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        return sketch
+
+def is_identifier(name):
+    """Identifier columns grow from file to file and do not have a meaningful distribution"""
+    name = str(name).lower()
+    return name == "id" or name.endswith("_id")
+
+class ColumnHistory:
+    """
+    Persistent per-sender quantile sketches of every numeric column seen so far.
+
+    Values are flagged as outliers when they fall outside Tukey fences
+    computed from the sender's earlier submissions, and then folded into
+    the history, so each column is read once per file. A file is checked
+    and saved while holding its sender's lock, see sender_lock, so files of
+    the same sender from concurrent sessions do not interleave.
+    """
+
+    def __init__(self, directory=None, fence=3.0, min_history=100):
+        self.directory = directory or get_data_dir("column_sketches")
+        self.fence = fence
+        self.min_history = min_history
+        self.sketches = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def sender_lock(self, sender):
+        """Lock to hold while checking and saving the columns of one of the sender's files"""
+        with self.lock:
+            return self.locks.setdefault(sender, threading.Lock())
+
+    def _path(self, sender):
+        return os.path.join(self.directory, f"{safe_key(sender)}.json")
+
+    def get_sketches(self, sender):
+        """Returns the column sketches of a sender, loading them from disk on first use"""
+        if sender not in self.sketches:
+            columns = {}
+            if os.path.exists(self._path(sender)):
+                with open(self._path(sender)) as f:
+                    columns = {name: QuantileSketch.from_dict(data) for name, data in json.load(f).items()}
+            self.sketches[sender] = columns
+        return self.sketches[sender]
+
+    def save(self, sender):
+        """Persist the column sketches of a sender"""
+        data = {name: sketch.to_dict() for name, sketch in self.get_sketches(sender).items()}
+        tmp_path = f"{self._path(sender)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(sender))
+
+    def outlier_mask(self, sketch, values):
+        """
+        Flags values outside the fences of a column's historical distribution.
+
+        Quartiles are only known to within a bin, so on narrow distributions
+        q1 and q3 can fall into the same bin. The spread is therefore never
+        taken below the width of a bin at the quartiles' magnitude, and a
+        history that is constant at zero gives no scale to judge by.
+
+        Returns:
+            np.ndarray: Boolean mask, all False while the history is too short to judge
+        """
+        no_outliers = np.zeros(len(values), dtype=bool)
+        if sketch.count < self.min_history:
+            return no_outliers
+        q1, q3 = sketch.quantile(0.25), sketch.quantile(0.75)
+        spread = max(q3 - q1, 2 * sketch.relative_accuracy * max(abs(q1), abs(q3)))
+        if spread == 0:
+            return no_outliers
+        return (values < q1 - self.fence * spread) | (values > q3 + self.fence * spread)
+
+    def check_column(self, sender, name, values):
+        """
+        Finds outliers in one numeric column and adds the column to the sender's history.
+
+        Columns have independent sketches, so different columns of the same
+        sender can be checked from different threads once get_sketches has
+        loaded them.
+
+        Args:
+            sender (str): Sender of the data
+            name (str): Column name
+            values (np.ndarray): Column values as floats, NaN for missing values
+
+        Returns:
+            np.ndarray: Boolean mask of the outlier values
+        """
+        sketch = self.get_sketches(sender).setdefault(str(name), QuantileSketch())
+        mask = self.outlier_mask(sketch, values)
+        sketch.update(values)
+        return mask
+
+def get_column_history(directory=None):
+    """Returns the process-wide column history of a directory, whose sketches are loaded once per sender"""
+    directory = os.path.abspath(directory or get_data_dir("column_sketches"))
+    return get_shared("column_history", directory, lambda: ColumnHistory(directory))
@@ -0,0 +1,117 @@
+import time
+import random
+import threading
+from collections import OrderedDict
+from utils.shared import get_shared
+
+# Share of requests that hit a slow path on the system (GC pause, lock wait, cold cache)
+SLOW_REQUEST_PROBABILITY = 0.05
+SLOW_REQUEST_FACTOR = 4.0
+
+# Share of requests that fail with a transient error, half of them after the system applied the batch
+TRANSIENT_FAILURE_PROBABILITY = 0.02
+
+# Uploads each system remembers idempotency keys and acknowledged offsets for
+MAX_REMEMBERED_UPLOADS = 10000
+
+class _SystemState:
+    """Server-side state of a simulated system, shared by all connections to it"""
+
+    def __init__(self):
+        self.applied = OrderedDict()  # batch idempotency key -> True
+        self.committed = OrderedDict()  # upload key -> records acknowledged so far
+        self.lock = threading.Lock()
+
+    def apply(self, upload_key, offset, record_count):
+        """Applies a batch once, returns (applied, acknowledged offset of the upload)"""
+        batch_key = f"{upload_key}:{offset}"
+        with self.lock:
+            applied = batch_key not in self.applied
+            if applied:
+                self.applied[batch_key] = True
+                self.committed[upload_key] = max(self.committed.get(upload_key, 0), offset + record_count)
+                self.committed.move_to_end(upload_key)
+            while len(self.committed) > MAX_REMEMBERED_UPLOADS:
+                self.committed.popitem(last=False)
+            while len(self.applied) > MAX_REMEMBERED_UPLOADS:
+                self.applied.popitem(last=False)
+            return applied, self.committed.get(upload_key, 0)
+
+    def committed_offset(self, upload_key):
+        with self.lock:
+            return self.committed.get(upload_key, 0)
+
+def _system_state(system_name):
+    return get_shared("system_state", system_name, _SystemState)
+
+class SimulatedSystemConnection:
+    """
+    Client connection to a simulated core system.
+
+    The first request on a connection stands for the TCP/TLS handshake and
+    authentication, whose cost is the system's connect_latency, so it should
+    be paid once per pooled connection rather than once per file. Requests
+    block for the simulated round trip, like a real client would, a few of
+    them take the slow path that makes up the latency tail, and a few fail
+    with a transient error.
+
+    Uploads are sent in batches. Each batch is identified by the upload key
+    and its offset, so a batch sent twice, by a hedge or a retry, is applied
+    once, and the system reports how many records of an upload it has
+    acknowledged, so an interrupted upload resumes where it stopped.
+    """
+
+    def __init__(self, system):
+        self.system_name = system["name"]
+        self.latency = system["latency"]
+        self.connect_latency = system["connect_latency"]
+        self.state = _system_state(self.system_name)
+        self.connected = False
+        self.open = True
+
+    def _round_trip(self):
+        if not self.connected:
+            time.sleep(self.connect_latency)
+            self.connected = True
+        request_time = (self.latency - self.connect_latency) * random.uniform(0.8, 1.2)
+        if random.random() < SLOW_REQUEST_PROBABILITY:
+            request_time *= SLOW_REQUEST_FACTOR
+        time.sleep(request_time)
+
+    def send_batch(self, upload_key, offset, record_count):
+        """
+        Sends one batch of an upload and waits for the acknowledgement.
+
+        Args:
+            upload_key (str): Idempotency key of the upload
+            offset (int): Position of the batch's first record in the upload
+            record_count (int): Number of records in the batch
+
+        Returns:
+            dict: latency in seconds, duplicate if the batch was applied before, and committed_offset of the upload
+
+        Raises:
+            ConnectionError: On a transient failure, the batch may or may not have been applied
+        """
+        start_time = time.perf_counter()
+        self._round_trip()
+        failure = random.random() < TRANSIENT_FAILURE_PROBABILITY
+        if failure and random.random() < 0.5:
+            raise ConnectionError(f"{self.system_name} reset the connection")
+        applied, committed_offset = self.state.apply(upload_key, offset, record_count)
+        if failure:
+            # Applied, but the acknowledgement was lost on the way back
+            raise ConnectionError(f"{self.system_name} did not acknowledge the batch")
+        return {"latency": time.perf_counter() - start_time, "duplicate": not applied, "committed_offset": committed_offset}
+
+    def committed_offset(self, upload_key):
+        """Number of records of an upload the system has acknowledged"""
+        self._round_trip()
+        return self.state.committed_offset(upload_key)
+
+    def ping(self):
+        """Health check, True while the connection is usable"""
+        return self.open
+
+    def close(self):
+        self.open = False
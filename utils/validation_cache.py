@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import numpy as np
+from utils.file_utils import get_data_dir
+from utils.shared import get_shared
+
+class ValidationCache:
+    """
+    Bounded on-disk cache of the validation work that depends only on a file's content.
+
+    Entries hold what the checks derived from the parsed file (row hashes,
+    masks, numeric columns) as JSON plus a .npz file of arrays, keyed by
+    sender, content hash and rule-set version, so an unchanged file is not
+    parsed again while the checks against the sender's history still run
+    on every submission. The rule-set version of an entry combines the
+    global rules version with a per-sender revision, so changing one
+    sender's rules only invalidates that sender's entries. Least recently
+    used entries are evicted beyond max_entries or max_bytes.
+    """
+
+    def __init__(self, rules_version, directory=None, max_entries=1000, max_bytes=1024 ** 3):
+        self.rules_version = str(rules_version)
+        self.directory = directory or get_data_dir("validation_cache")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(self.directory, "cache.sqlite3"), check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "sender TEXT NOT NULL, content_hash TEXT NOT NULL, rules_version TEXT NOT NULL, "
+                "entry_id TEXT NOT NULL, metadata TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (sender, content_hash, rules_version))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sender_rules (sender TEXT PRIMARY KEY, revision INTEGER NOT NULL)"
+            )
+
+    def _arrays_path(self, entry_id):
+        return os.path.join(self.directory, f"{entry_id}.npz")
+
+    def _rules_version(self, sender):
+        """Global rules version combined with the sender's rule revision"""
+        row = self.connection.execute("SELECT revision FROM sender_rules WHERE sender = ?", (sender,)).fetchone()
+        return f"{self.rules_version}.{row[0] if row else 0}"
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, sender, content_hash):
+        """
+        Looks up the cached content checks of a file.
+
+        Args:
+            sender (str): Sender of the file
+            content_hash (str): SHA-256 of the file content
+
+        Returns:
+            tuple or None: The metadata dict and a dict of np.ndarray, or None on a miss
+        """
+        with self.lock:
+            key = (sender, content_hash, self._rules_version(sender))
+            row = self.connection.execute(
+                "SELECT entry_id, metadata FROM entries WHERE sender = ? AND content_hash = ? AND rules_version = ?", key
+            ).fetchone()
+            arrays = None
+            if row is not None and os.path.isfile(self._arrays_path(row[0])):
+                with np.load(self._arrays_path(row[0])) as data:
+                    arrays = {name: data[name] for name in data.files}
+            if arrays is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE entries SET last_used = ? WHERE sender = ? AND content_hash = ? AND rules_version = ?",
+                    (time.time(),) + key
+                )
+            return json.loads(row[1]), arrays
+
+    def put(self, sender, content_hash, metadata, arrays):
+        """
+        Stores the content checks of a file, evicting the least recently used entries beyond the bounds.
+
+        Args:
+            sender (str): Sender of the file
+            content_hash (str): SHA-256 of the file content
+            metadata (dict): JSON-serializable results
+            arrays (dict): Name -> np.ndarray, names must be valid file names
+        """
+        entry_id = uuid.uuid4().hex
+        path = self._arrays_path(entry_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        metadata = json.dumps(metadata)
+        size = os.path.getsize(path) + len(metadata)
+
+        with self.lock:
+            key = (sender, content_hash, self._rules_version(sender))
+            replaced = self.connection.execute(
+                "SELECT entry_id FROM entries WHERE sender = ? AND content_hash = ? AND rules_version = ?", key
+            ).fetchall()
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    key + (entry_id, metadata, size, time.time())
+                )
+            self._remove_files(replaced)
+            self._evict()
+
+    def _evict(self):
+        evicted = []
+        total = 0
+        for count, (entry_id, size) in enumerate(
+            self.connection.execute("SELECT entry_id, size FROM entries ORDER BY last_used DESC")
+        ):
+            total += size
+            # The newest entry is kept even if it alone exceeds max_bytes
+            if count and (count >= self.max_entries or total > self.max_bytes):
+                evicted.append((entry_id,))
+        if evicted:
+            with self.connection:
+                self.connection.executemany("DELETE FROM entries WHERE entry_id = ?", evicted)
+            self._remove_files(evicted)
+
+    def _remove_files(self, rows):
+        for (entry_id,) in rows:
+            try:
+                os.remove(self._arrays_path(entry_id))
+            except FileNotFoundError:
+                pass
+
+    def invalidate_sender(self, sender):
+        """Bumps the rule revision of a sender, dropping only that sender's cached entries"""
+        with self.lock:
+            removed = self.connection.execute("SELECT entry_id FROM entries WHERE sender = ?", (sender,)).fetchall()
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO sender_rules VALUES (?, 1) "
+                    "ON CONFLICT (sender) DO UPDATE SET revision = revision + 1",
+                    (sender,)
+                )
+                self.connection.execute("DELETE FROM entries WHERE sender = ?", (sender,))
+            self._remove_files(removed)
+
+def get_validation_cache(rules_version, directory=None):
+    """Returns the process-wide validation cache of a directory, whose hit counts span reruns"""
+    directory = os.path.abspath(directory or get_data_dir("validation_cache"))
+    return get_shared("validation_cache", (directory, str(rules_version)), lambda: ValidationCache(rules_version, directory))
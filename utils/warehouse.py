@@ -0,0 +1,135 @@
+import os
+import time
+import sqlite3
+from itertools import islice
+from utils.file_utils import get_data_dir
+from utils.connection_pool import get_pool
+from utils.retry import backoff_delay, MAX_RETRIES
+
+DEFAULT_BATCH_SIZE = 5000
+
+# One statement text for every batch, so SQLite compiles it once and reuses the prepared statement
+INSERT_RECORD = (
+    "INSERT INTO records (load_id, filename, sender, row_number, record, loaded_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+def connect_warehouse(path):
+    """Opens a warehouse connection in autocommit mode, transactions are opened explicitly per batch"""
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS records ("
+        "load_id TEXT NOT NULL, filename TEXT NOT NULL, sender TEXT NOT NULL, "
+        "row_number INTEGER NOT NULL, record TEXT NOT NULL, loaded_at REAL NOT NULL)"
+    )
+    # Idempotency keys of committed batches, written in the same transaction as their rows
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS load_batches ("
+        "load_id TEXT NOT NULL, batch_offset INTEGER NOT NULL, PRIMARY KEY (load_id, batch_offset))"
+    )
+    return connection
+
+class WarehouseLoader:
+    """
+    Bulk loader into a local SQLite database standing in for the data warehouse.
+
+    Records are written in the common format, one JSON document per row,
+    with executemany in batches of batch_size rows. Each batch is one
+    explicit transaction, so the cost of a commit is paid per batch rather
+    than per row. Connections come from a process-wide pool and are shared
+    by all loads and worker threads.
+
+    A batch is identified by the load id and the offset of its first
+    record. A batch that fails transiently, e.g. on a busy database, is
+    retried with jittered backoff, and a batch that was already committed,
+    by an earlier attempt of the same load, is skipped, so loading again
+    resumes after the last committed batch.
+    """
+
+    def __init__(self, path=None, batch_size=DEFAULT_BATCH_SIZE, min_connections=1, max_connections=4):
+        self.path = path or os.path.join(get_data_dir("warehouse"), "warehouse.sqlite3")
+        self.batch_size = batch_size
+        self.pool = get_pool(
+            f"warehouse:{os.path.abspath(self.path)}",
+            connect=lambda: connect_warehouse(self.path),
+            min_size=min_connections,
+            max_size=max_connections,
+            health_check=lambda connection: connection.execute("SELECT 1").fetchone() == (1,)
+        )
+
+    def load(self, load_id, filename, sender, records):
+        """
+        Writes records to the warehouse.
+
+        Args:
+            load_id (str): Identifier of this load, stored with every row
+            filename (str): Source file name
+            sender (str): Sender of the source file
+            records (iterable): (row number, JSON document) pairs
+
+        Returns:
+            dict: rows, batches, batches_skipped, retries, seconds and rows_per_second of the load
+        """
+        start_time = time.perf_counter()
+        rows = 0
+        batches = 0
+        batches_skipped = 0
+        retries = 0
+        records = iter(records)
+        with self.pool.connection() as pooled:
+            connection = pooled.raw
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                for attempt in range(MAX_RETRIES + 1):
+                    try:
+                        committed = self._write_batch(connection, load_id, rows, filename, sender, batch)
+                        break
+                    except sqlite3.OperationalError:
+                        if attempt == MAX_RETRIES:
+                            raise
+                        retries += 1
+                        time.sleep(backoff_delay(attempt))
+                rows += len(batch)
+                batches += 1
+                batches_skipped += not committed
+        seconds = time.perf_counter() - start_time
+        return {
+            "rows": rows,
+            "batches": batches,
+            "batches_skipped": batches_skipped,
+            "retries": retries,
+            "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds > 0 else 0.0
+        }
+
+    def _write_batch(self, connection, load_id, batch_offset, filename, sender, batch):
+        """Writes one batch in its own transaction, returns False if it had been committed before"""
+        loaded_at = time.time()
+        # Take the write lock up front, so a busy database fails here rather than half way
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if connection.execute(
+                "SELECT 1 FROM load_batches WHERE load_id = ? AND batch_offset = ?", (load_id, batch_offset)
+            ).fetchone():
+                connection.execute("ROLLBACK")
+                return False
+            connection.executemany(
+                INSERT_RECORD,
+                ((load_id, filename, sender, row_number, record, loaded_at) for row_number, record in batch)
+            )
+            connection.execute("INSERT INTO load_batches (load_id, batch_offset) VALUES (?, ?)", (load_id, batch_offset))
+        except Exception:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return True
+
+    def count(self, load_id):
+        """Number of rows stored by a load"""
+        with self.pool.connection() as pooled:
+            return pooled.raw.execute("SELECT COUNT(*) FROM records WHERE load_id = ?", (load_id,)).fetchone()[0]
@@ -0,0 +1,214 @@
+import os
+import time
+import uuid
+import queue
+import threading
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from utils.file_utils import get_data_dir
+from utils.shared import get_shared
+
+# Names written by upload clients before the final rename, never picked up
+PARTIAL_SUFFIXES = (".part", ".partial", ".tmp", ".filepart", ".crdownload")
+
+# Sub-directories of the drop directory that files are moved to once they were handed over
+PROCESSED_DIR = "processed"
+FAILED_DIR = "failed"
+
+def is_partial_file(path):
+    name = os.path.basename(path)
+    return name.startswith((".", "~")) or name.lower().endswith(PARTIAL_SUFFIXES)
+
+class _DropHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.touch(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.forget(event.src_path)
+            self.watcher.touch(event.dest_path)
+
+class DropFolderWatcher:
+    """
+    Picks up files landing in a drop directory through filesystem events.
+
+    A file is ready once no event arrived for it during the debounce
+    interval and its size stopped changing, so files still being written
+    are not read half way. Files that become ready close together are
+    coalesced into one micro-batch on the ready queue. The flusher thread
+    sleeps until the next file can become ready instead of polling, and
+    calls the registered listeners when a batch is ready.
+
+    Files that were handed over are moved to the processed/ or failed/
+    sub-directory with settle, so the drop directory only holds files not
+    taken yet and a restart does not ingest the same files again.
+    """
+
+    def __init__(self, directory=None, debounce=0.25, batch_window=0.05, max_batch=50):
+        self.directory = directory or get_data_dir("drop")
+        self.debounce = debounce
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.ready = queue.Queue()
+        self.pending = {}  # path -> (last event time, size at that time)
+        self.listeners = {}  # key -> callable, see add_listener
+        self.condition = threading.Condition()
+        self.observer = None
+        self.flusher = None
+        self.running = False
+
+    def start(self, include_existing=True):
+        """Starts watching, optionally treating files already in the directory as new arrivals"""
+        if self.running:
+            return
+        self.running = True
+        self.observer = Observer()
+        self.observer.schedule(_DropHandler(self), self.directory, recursive=False)
+        self.observer.start()
+        self.flusher = threading.Thread(target=self._flush_loop, name="drop-folder-flusher", daemon=True)
+        self.flusher.start()
+        if include_existing:
+            for name in sorted(os.listdir(self.directory)):
+                self.touch(os.path.join(self.directory, name))
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.observer.stop()
+        with self.condition:
+            self.condition.notify()
+        self.observer.join()
+        self.flusher.join()
+
+    def touch(self, path):
+        """Records activity on a file, restarting its debounce interval"""
+        # Moves into processed/ and failed/ show up as events too
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.directory):
+            return
+        if is_partial_file(path) or not os.path.isfile(path):
+            return
+        with self.condition:
+            self.pending[path] = (time.monotonic(), os.path.getsize(path))
+            self.condition.notify()
+
+    def forget(self, path):
+        with self.condition:
+            self.pending.pop(path, None)
+
+    def _take_ready(self, now):
+        """Remove the files that settled from pending, returns (ready paths, seconds until the next check)"""
+        ready = []
+        next_check = None
+        for path, (last_event, size) in list(self.pending.items()):
+            wait = last_event + self.debounce - now
+            if wait > 0:
+                next_check = wait if next_check is None else min(next_check, wait)
+                continue
+            if not os.path.isfile(path):
+                del self.pending[path]
+                continue
+            current_size = os.path.getsize(path)
+            if current_size != size:
+                # Still growing without events, e.g. on network file systems
+                self.pending[path] = (now, current_size)
+                next_check = self.debounce if next_check is None else min(next_check, self.debounce)
+                continue
+            del self.pending[path]
+            ready.append(path)
+        return ready, next_check
+
+    def _flush_loop(self):
+        while self.running:
+            with self.condition:
+                ready, next_check = self._take_ready(time.monotonic())
+                # Files that settle within the batch window join the same batch
+                while ready and next_check is not None and next_check <= self.batch_window and len(ready) < self.max_batch:
+                    self.condition.wait(timeout=next_check)
+                    more, next_check = self._take_ready(time.monotonic())
+                    ready.extend(more)
+                if not ready:
+                    self.condition.wait(timeout=next_check)
+                    continue
+            ready.sort()
+            for start in range(0, len(ready), self.max_batch):
+                self.ready.put(ready[start:start + self.max_batch])
+            self._notify_listeners()
+
+    def add_listener(self, key, callback):
+        """
+        Registers a callback for new batches, replacing an earlier one under the same key.
+
+        The callback runs on the flusher thread, so it should only signal
+        that batches are ready and leave draining them to its own thread.
+        A callback that returns False is removed.
+        """
+        with self.condition:
+            self.listeners[key] = callback
+
+    def remove_listener(self, key):
+        with self.condition:
+            self.listeners.pop(key, None)
+
+    def _notify_listeners(self):
+        with self.condition:
+            listeners = list(self.listeners.items())
+        for key, callback in listeners:
+            if callback() is False:
+                self.remove_listener(key)
+
+    def settle(self, path, failed=False):
+        """
+        Moves a file that was handed over out of the drop directory.
+
+        Args:
+            path (str): File in the drop directory
+            failed (bool): Whether the file could not be taken, e.g. an unsupported type
+
+        Returns:
+            str: New path of the file
+        """
+        target_dir = os.path.join(self.directory, FAILED_DIR if failed else PROCESSED_DIR)
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, os.path.basename(path))
+        if os.path.exists(target):
+            # Keep earlier files of the same name
+            stem, extension = os.path.splitext(os.path.basename(path))
+            target = os.path.join(target_dir, f"{stem}_{uuid.uuid4().hex[:8]}{extension}")
+        os.replace(path, target)
+        return target
+
+    def drain(self):
+        """
+        Takes the micro-batches that became ready since the last call, without blocking.
+
+        Returns:
+            list: Batches of file paths, oldest first
+        """
+        batches = []
+        while True:
+            try:
+                batches.append(self.ready.get_nowait())
+            except queue.Empty:
+                return batches
+
+    def has_ready(self):
+        return not self.ready.empty()
+
+def get_watcher(directory=None):
+    """Returns the process-wide watcher of a drop directory, starting it on first use"""
+    directory = os.path.abspath(directory or get_data_dir("drop"))
+
+    def create():
+        watcher = DropFolderWatcher(directory)
+        watcher.start()
+        return watcher
+    return get_shared("drop_watcher", directory, create)